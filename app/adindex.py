@@ -0,0 +1,461 @@
+import asyncio
+import logging
+import math
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from heapq import nlargest, nsmallest
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import select
+from app import models
+from app.config import settings
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+SORT_FIELDS = ("price", "created_at")
+LOAD_CHUNK_SIZE = 10000
+# До стольких изменений за раз - сдвиг массивов на месте, больше - сборка срезами
+SPLICE_THRESHOLD = 64
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def timestamp_us(value) -> int:
+    # created_at в микросекундах: целые сравниваются точно, как в БД
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return (value - _EPOCH) // _MICROSECOND
+
+
+class Entry(NamedTuple):
+    id: int
+    price: float
+    created_at: Any
+
+
+class SortedColumn:
+    # Значения по возрастанию (значение, id) и id объявлений в том же порядке
+    __slots__ = ("values", "ids")
+
+    def __init__(self, values: array, ids: array):
+        self.values = values
+        self.ids = ids
+
+    def position(self, value, advertisement_id: int, right: bool = False) -> int:
+        lo = bisect_left(self.values, value)
+        hi = bisect_right(self.values, value, lo)
+        if right:
+            return bisect_right(self.ids, advertisement_id, lo, hi)
+        return bisect_left(self.ids, advertisement_id, lo, hi)
+
+    def _found(self, value, advertisement_id: int) -> Optional[int]:
+        position = self.position(value, advertisement_id)
+        if position < len(self.ids) and self.ids[position] == advertisement_id:
+            return position
+        return None
+
+    def update(self, removed: List[Tuple[Any, int]], added: List[Tuple[Any, int]]):
+        if len(removed) + len(added) <= SPLICE_THRESHOLD:
+            for value, advertisement_id in removed:
+                position = self._found(value, advertisement_id)
+                if position is not None:
+                    del self.values[position]
+                    del self.ids[position]
+            for value, advertisement_id in added:
+                position = self.position(value, advertisement_id)
+                self.values.insert(position, value)
+                self.ids.insert(position, advertisement_id)
+            return
+
+        # Пакет: один проход копирования срезами вместо сдвига на каждую строку
+        if removed:
+            positions = sorted(
+                position for position in (self._found(value, key) for value, key in removed)
+                if position is not None
+            )
+            self.values, self.ids = _cut(self.values, positions), _cut(self.ids, positions)
+        if added:
+            added = sorted(added)
+            positions = [self.position(value, key) for value, key in added]
+            self.values, self.ids = (
+                _splice(self.values, positions, [value for value, _ in added]),
+                _splice(self.ids, positions, [key for _, key in added])
+            )
+
+
+def _cut(values: array, positions: List[int]) -> array:
+    result = array(values.typecode)
+    start = 0
+    for position in positions:
+        result += values[start:position]
+        start = position + 1
+    result += values[start:]
+    return result
+
+
+def _splice(values: array, positions: List[int], items: list) -> array:
+    result = array(values.typecode)
+    start = 0
+    for position, item in zip(positions, items):
+        result += values[start:position]
+        result.append(item)
+        start = position
+    result += values[start:]
+    return result
+
+
+def _empty_column(typecode: str) -> SortedColumn:
+    return SortedColumn(array(typecode), array("q"))
+
+
+class AdvertisementIndex:
+    # Колонки price и created_at по id объявления (NaN - объявления нет) и два
+    # порядка сортировки. Отвечает на фильтр по цене с сортировкой по цене или
+    # дате бинарным поиском и срезами; строки страницы читаются из БД по id.
+    # Запись и чтение - под одной блокировкой (чтение - не дольше AD_INDEX_MAX_SCAN строк);
+    # event loop ее не ждет: пишет через submit, читает с wait=False
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.price_by_id = array("d")
+        self.created_by_id = array("q")
+        self.by_price = _empty_column("d")
+        self.by_created_at = _empty_column("q")
+        self.ready = False
+        self.loaded_at: Optional[float] = None
+        # Изменения во время пересборки: применяются к новому индексу перед заменой
+        self._journal: Optional[list] = None
+        # Изменения для потока записи (submit), еще не взятые им
+        self._pending_lock = threading.Lock()
+        self._pending: Optional[dict] = None
+        self.hits = 0
+        self.fallbacks = 0
+        self.stale = 0
+
+    def size(self) -> int:
+        return len(self.by_price.ids)
+
+    def _current(self, advertisement_id: int) -> Optional[Tuple[float, int]]:
+        if advertisement_id >= len(self.price_by_id) or math.isnan(self.price_by_id[advertisement_id]):
+            return None
+        return self.price_by_id[advertisement_id], self.created_by_id[advertisement_id]
+
+    def _apply(self, changes: dict):
+        # changes: id -> (price, created_at в мкс) или None для удаленного
+        removed_price, removed_created, added_price, added_created = [], [], [], []
+        for advertisement_id, new in changes.items():
+            old = self._current(advertisement_id)
+            if old == new:
+                continue
+            if old is not None:
+                removed_price.append((old[0], advertisement_id))
+                removed_created.append((old[1], advertisement_id))
+                self.price_by_id[advertisement_id] = math.nan
+            if new is not None:
+                if advertisement_id >= len(self.price_by_id):
+                    missing = advertisement_id + 1 - len(self.price_by_id)
+                    self.price_by_id += array("d", [math.nan]) * missing
+                    self.created_by_id += array("q", [0]) * missing
+                self.price_by_id[advertisement_id], self.created_by_id[advertisement_id] = new
+                added_price.append((new[0], advertisement_id))
+                added_created.append((new[1], advertisement_id))
+        self.by_price.update(removed_price, added_price)
+        self.by_created_at.update(removed_created, added_created)
+
+    def _record(self, changes: dict):
+        with self._lock:
+            # До первой загрузки изменения не нужны: их прочитает загрузка
+            if not self.ready and self._journal is None:
+                return
+            if self._journal is not None:
+                self._journal.append(changes)
+            self._apply(changes)
+
+    def changed(self, rows: Iterable):
+        # Строки с id, price и created_at после commit записи
+        self._record({row.id: (row.price, timestamp_us(row.created_at)) for row in rows})
+
+    def deleted(self, advertisement_ids: Iterable[int]):
+        self._record(dict.fromkeys(advertisement_ids))
+
+    def submit(self, changes: dict):
+        # Из event loop: изменения применяет поток записи, loop не ждет блокировку.
+        # Пока поток занят, новые изменения сливаются в одно применение
+        with self._pending_lock:
+            if self._pending is not None:
+                self._pending.update(changes)
+                return
+            self._pending = dict(changes)
+        _writer.submit(self._apply_pending)
+
+    def _apply_pending(self):
+        with self._pending_lock:
+            changes, self._pending = self._pending, None
+        try:
+            self._record(changes)
+        except Exception:
+            logger.exception("Cannot update advertisement index")
+
+    def load(self):
+        with self._lock:
+            self._journal = []
+        try:
+            ids, prices, created = array("q"), array("d"), array("q")
+            statement = (
+                select(models.Advertisement.id, models.Advertisement.price, models.Advertisement.created_at)
+                .order_by(models.Advertisement.id)
+                .execution_options(yield_per=LOAD_CHUNK_SIZE)
+            )
+            with SessionLocal() as db:
+                for partition in db.execute(statement).partitions():
+                    for advertisement_id, price, created_at in partition:
+                        ids.append(advertisement_id)
+                        prices.append(price)
+                        created.append(timestamp_us(created_at))
+
+            length = ids[-1] + 1 if ids else 0
+            price_by_id = array("d", [math.nan]) * length
+            created_by_id = array("q", [0]) * length
+            for advertisement_id, price, created_at in zip(ids, prices, created):
+                price_by_id[advertisement_id] = price
+                created_by_id[advertisement_id] = created_at
+            # ids по возрастанию, сортировка устойчивая: при равных значениях - по id
+            price_order = array("q", sorted(ids, key=price_by_id.__getitem__))
+            created_order = array("q", sorted(ids, key=created_by_id.__getitem__))
+            by_price = SortedColumn(array("d", map(price_by_id.__getitem__, price_order)), price_order)
+            by_created_at = SortedColumn(array("q", map(created_by_id.__getitem__, created_order)), created_order)
+
+            with self._lock:
+                self.price_by_id, self.created_by_id = price_by_id, created_by_id
+                self.by_price, self.by_created_at = by_price, by_created_at
+                for changes in self._journal:
+                    self._apply(changes)
+                self.ready = True
+                self.loaded_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._journal = None
+
+    def search(
+            self,
+            title: Optional[str] = None,
+            author: Optional[str] = None,
+            description: Optional[str] = None,
+            min_price: Optional[float] = None,
+            max_price: Optional[float] = None,
+            search_text: Optional[str] = None,
+            skip: int = 0,
+            limit: Optional[int] = 100,
+            sort_by: str = "created_at",
+            sort_order: str = "desc",
+            after: Optional[Tuple[Any, int]] = None,
+            columns: Optional[Tuple[str, ...]] = None,
+            wait: bool = True
+    ) -> Optional[List[int]]:
+        # id страницы по порядку; None - запрос должна выполнить БД.
+        # wait=False (из event loop): индекс занят записью - сразу в БД
+        if (
+                not self.ready or title or author or description or search_text or limit is None
+                or sort_by not in SORT_FIELDS
+                or (columns is not None and not {"id", "price", "created_at"} <= set(columns))
+        ):
+            return None
+        ascending = sort_order.lower() == "asc"
+        if sort_by == "created_at" and after is not None:
+            after = (timestamp_us(after[0]), after[1])
+
+        if not self._lock.acquire(blocking=wait):
+            self.fallbacks += 1
+            return None
+        try:
+            by_price, by_created_at = self.by_price, self.by_created_at
+            lo = 0 if min_price is None else bisect_left(by_price.values, min_price)
+            hi = len(by_price.ids) if max_price is None else bisect_right(by_price.values, max_price)
+            if sort_by == "price":
+                ids = _page(by_price, lo, hi, ascending, after, skip, limit)
+            elif min_price is None and max_price is None:
+                ids = _page(by_created_at, 0, len(by_created_at.ids), ascending, after, skip, limit)
+            else:
+                ids = self._created_at_page(lo, hi, min_price, max_price, ascending, after, skip, limit)
+        finally:
+            self._lock.release()
+        if ids is None:
+            self.fallbacks += 1
+        else:
+            self.hits += 1
+        return ids
+
+    def _created_at_page(self, lo: int, hi: int, min_price, max_price,
+                         ascending: bool, after, skip: int, limit: int) -> Optional[List[int]]:
+        # Дешевле из двух: идти по порядку created_at, проверяя цену (в среднем
+        # need * n / band строк), или выбрать страницу из всех объявлений диапазона цен
+        column = self.by_created_at
+        band = hi - lo
+        if band <= 0:
+            return []
+        need = skip + limit
+        scan = need * len(column.ids) // band
+        if min(scan, band) > settings.AD_INDEX_MAX_SCAN:
+            return None
+
+        if band <= scan:
+            created_by_id = self.created_by_id
+            keys = (
+                (created_by_id[advertisement_id], advertisement_id) for advertisement_id in self.by_price.ids[lo:hi]
+            )
+            if after is not None:
+                keys = (key for key in keys if (key > after if ascending else key < after))
+            page = nsmallest(need, keys) if ascending else nlargest(need, keys)
+            return [advertisement_id for _, advertisement_id in page[skip:]]
+
+        low = -math.inf if min_price is None else min_price
+        high = math.inf if max_price is None else max_price
+        price_by_id = self.price_by_id
+        step = max(need, 256)
+        found: List[int] = []
+        if ascending:
+            position = 0 if after is None else column.position(*after, right=True)
+            start = position
+            while position < len(column.ids) and len(found) < need:
+                if position - start > settings.AD_INDEX_MAX_SCAN:
+                    return None
+                chunk = column.ids[position:position + step]
+                position += step
+                found += [key for key in chunk if low <= price_by_id[key] <= high]
+        else:
+            position = len(column.ids) if after is None else column.position(*after)
+            start = position
+            while position > 0 and len(found) < need:
+                if start - position > settings.AD_INDEX_MAX_SCAN:
+                    return None
+                chunk = column.ids[max(0, position - step):position]
+                position -= step
+                chunk.reverse()
+                found += [key for key in chunk if low <= price_by_id[key] <= high]
+        return found[skip:need]
+
+    def page(self, rows, ids: List[int], min_price=None, max_price=None,
+             sort_by: str = "created_at", sort_order: str = "desc", **params) -> Optional[list]:
+        # Строки из БД в порядке индекса. None - индекс отстал от БД (объявление
+        # удалено или изменено другим воркером): страницу строит запрос к БД
+        by_id = {row.id: row for row in rows}
+        page = [by_id.get(advertisement_id) for advertisement_id in ids]
+        valid = all(row is not None for row in page) and all(
+            (min_price is None or row.price >= min_price) and (max_price is None or row.price <= max_price)
+            for row in page
+        )
+        if valid:
+            keys = [(getattr(row, sort_by), row.id) for row in page]
+            valid = keys == sorted(keys, reverse=sort_order.lower() != "asc")
+        if not valid:
+            self.stale += 1
+            return None
+        return page
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.AD_INDEX,
+            "ready": self.ready,
+            "size": self.size(),
+            "bytes": sum(
+                values.itemsize * len(values)
+                for values in (
+                    self.price_by_id, self.created_by_id, self.by_price.values, self.by_price.ids,
+                    self.by_created_at.values, self.by_created_at.ids
+                )
+            ),
+            "age_seconds": None if self.loaded_at is None else round(time.monotonic() - self.loaded_at, 1),
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "stale": self.stale,
+        }
+
+
+def _page(column: SortedColumn, lo: int, hi: int, ascending: bool, after, skip: int, limit: int) -> List[int]:
+    if ascending:
+        if after is not None:
+            lo = max(lo, column.position(*after, right=True))
+        start = lo + skip
+        return column.ids[start:min(hi, start + limit)].tolist()
+    if after is not None:
+        hi = min(hi, column.position(*after))
+    end = hi - skip
+    if end <= lo:
+        return []
+    ids = column.ids[max(lo, end - limit):end]
+    ids.reverse()
+    return ids.tolist()
+
+
+advertisement_index = AdvertisementIndex()
+# Один поток: изменения применяются в порядке поступления
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="adindex")
+
+
+def enabled() -> bool:
+    return settings.AD_INDEX
+
+
+def changed(rows: Iterable):
+    if enabled():
+        advertisement_index.changed(rows)
+
+
+def deleted(advertisement_ids: Iterable[int]):
+    if enabled():
+        advertisement_index.deleted(advertisement_ids)
+
+
+def submit(changes: Dict[int, Optional[Any]]):
+    # id -> строка с price и created_at или None (удалено); для вызовов из event loop
+    if enabled():
+        advertisement_index.submit({
+            advertisement_id: None if row is None else (row.price, timestamp_us(row.created_at))
+            for advertisement_id, row in changes.items()
+        })
+
+
+def changed_later(rows: Iterable):
+    submit({row.id: row for row in rows})
+
+
+def deleted_later(advertisement_ids: Iterable[int]):
+    submit(dict.fromkeys(advertisement_ids))
+
+
+_resync: Optional[asyncio.Event] = None
+
+
+def request_resync():
+    # Изменения других воркеров могли потеряться (обрыв LISTEN)
+    if _resync is not None:
+        _resync.set()
+
+
+async def run():
+    loop = asyncio.get_running_loop()
+    while True:
+        _resync.clear()
+        try:
+            await loop.run_in_executor(None, advertisement_index.load)
+            logger.info("Advertisement index loaded: %d advertisements", advertisement_index.size())
+        except Exception:
+            logger.exception("Cannot load advertisement index")
+        try:
+            await asyncio.wait_for(_resync.wait(), settings.AD_INDEX_RESYNC_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start() -> Optional[asyncio.Task]:
+    global _resync
+    if not enabled():
+        return None
+    _resync = asyncio.Event()
+    return asyncio.create_task(run())
@@ -0,0 +1,148 @@
+import asyncio
+import json
+from typing import Dict, Optional
+from app.config import settings
+from app.metrics import ADMISSION_REJECTED, ADMISSION_WAIT
+
+AUTH = "auth"
+READ = "read"
+WRITE = "write"
+
+# Вход и регистрация: bcrypt в пуле процессов и запрос к БД
+AUTH_ROUTES = {("POST", "/login"), ("POST", "/token"), ("POST", "/refresh"), ("POST", "/user"), ("POST", "/user/")}
+# Служебные маршруты и SSE-поток (держит соединение часами, но не БД) не ограничиваются
+EXEMPT_PATHS = {"/", "/health", "/metrics", "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json"}
+EXEMPT_ROUTES = {("GET", "/advertisement/events")}
+
+QUEUE_FULL = "queue_full"
+TIMEOUT = "timeout"
+
+
+class Gate:
+    # Не больше limit запросов класса одновременно; остальные ждут в очереди
+    # не длиннее queue_size и не дольше timeout секунд
+    def __init__(self, name: str, limit: int, queue_size: int, timeout: float):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+
+    async def acquire(self) -> Optional[str]:
+        # None - допущен, иначе причина отказа
+        if self.active < self.limit and not self.waiting:
+            await self._semaphore.acquire()
+            self.active += 1
+            return None
+        if self.waiting >= self.queue_size:
+            return QUEUE_FULL
+        self.waiting += 1
+        try:
+            with ADMISSION_WAIT.labels(self.name).time():
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            return TIMEOUT
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return None
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting}
+
+
+def default_limits() -> Dict[str, int]:
+    # Чтения и записи вместе не превышают соединений пула воркера: запрос не ждет
+    # соединение DB_POOL_TIMEOUT секунд, а быстро получает 503 на входе
+    from app.database import pool_options
+    options = pool_options()
+    connections = options["pool_size"] + options["max_overflow"]
+    writes = max(1, connections // 3)
+    return {
+        AUTH: max(1, settings.HASH_POOL_WORKERS) * 2,
+        READ: max(1, connections - writes),
+        WRITE: writes,
+    }
+
+
+def _build_gates() -> Dict[str, Gate]:
+    defaults = default_limits()
+    configured = {
+        AUTH: settings.ADMISSION_AUTH_CONCURRENCY,
+        READ: settings.ADMISSION_READ_CONCURRENCY,
+        WRITE: settings.ADMISSION_WRITE_CONCURRENCY,
+    }
+    return {
+        name: Gate(
+            name,
+            configured[name] or defaults[name],
+            settings.ADMISSION_QUEUE_SIZE,
+            settings.ADMISSION_QUEUE_TIMEOUT
+        )
+        for name in (AUTH, READ, WRITE)
+    }
+
+
+gates = _build_gates()
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    if method == "OPTIONS" or path in EXEMPT_PATHS:
+        return None
+    prefix = settings.API_V1_PREFIX
+    if prefix and path.startswith(prefix):
+        path = path[len(prefix):]
+    if (method, path) in EXEMPT_ROUTES:
+        return None
+    if (method, path) in AUTH_ROUTES:
+        return AUTH
+    if method in ("GET", "HEAD"):
+        return READ
+    return WRITE
+
+
+def stats() -> dict:
+    return {name: gate.stats() for name, gate in gates.items()}
+
+
+BUSY_BODY = json.dumps({"detail": "Server is busy, try again later"}).encode("utf-8")
+
+
+class AdmissionControlMiddleware:
+    # Чистый ASGI-middleware: ограничение одновременных запросов по классам
+    # маршрутов (вход, чтение, запись) до того, как запрос займет поток или соединение БД
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        name = route_class(scope["method"], scope["path"])
+        if name is None:
+            return await self.app(scope, receive, send)
+
+        gate = gates[name]
+        rejected = await gate.acquire()
+        if rejected is not None:
+            ADMISSION_REJECTED.labels(name, rejected).inc()
+            await send({
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(BUSY_BODY)).encode("latin-1")),
+                    (b"retry-after", str(settings.ADMISSION_RETRY_AFTER_SECONDS).encode("latin-1")),
+                ],
+            })
+            await send({"type": "http.response.body", "body": BUSY_BODY})
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            gate.release()
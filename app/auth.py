@@ -1,24 +1,28 @@
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from app import crud, schemas
+from app import dal, schemas
+from app.cache import principal_cache
+from app.revocations import revocations
 from app.config import settings
-from app.database import get_db
+from app.database import DbSession, get_session
+from app.hashing import pwd_context, verify_password, get_password_hash
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+ACCESS = "access"
+REFRESH = "refresh"
 
 
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -26,40 +30,81 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(hours=settings.ACCESS_TOKEN_EXPIRE_HOURS)
+        expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
 
     to_encode.update({"exp": expire})
+    to_encode.setdefault("type", ACCESS)
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 
-async def get_current_user(
-        credentials: HTTPAuthorizationCredentials = Depends(security),
-        db: Session = Depends(get_db)
-) -> schemas.UserInDB:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+def refresh_token_lifetime() -> timedelta:
+    return timedelta(hours=settings.ACCESS_TOKEN_EXPIRE_HOURS or settings.REFRESH_TOKEN_EXPIRE_HOURS)
+
+
+def issue_tokens(user) -> dict:
+    # ver - версия токенов пользователя: после ее увеличения старые токены отклоняются
+    claims = {"sub": user.username, "user_id": user.id, "ver": user.token_version}
+    return {
+        "access_token": create_access_token({**claims, "role": user.role.value}),
+        "refresh_token": create_access_token({**claims, "type": REFRESH}, expires_delta=refresh_token_lifetime()),
+        "token_type": "bearer",
+        "expires_in": settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
 
+
+def decode_token(token: str, token_type: str) -> schemas.TokenData:
     try:
-        token = credentials.credentials
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        user_id: int = payload.get("user_id")
-        role: str = payload.get("role")
+    except JWTError:
+        raise _credentials_exception()
+
+    username: str = payload.get("sub")
+    user_id: int = payload.get("user_id")
+    # Токены, выданные до появления refresh-токенов, - access без версии
+    if username is None or user_id is None or payload.get("type", ACCESS) != token_type:
+        raise _credentials_exception()
+    return schemas.TokenData(
+        username=username,
+        user_id=user_id,
+        role=payload.get("role"),
+        version=payload.get("ver")
+    )
 
-        if username is None or user_id is None:
-            raise credentials_exception
 
-        token_data = schemas.TokenData(username=username, user_id=user_id, role=role)
-    except JWTError:
-        raise credentials_exception
+async def get_current_user(
+        credentials: HTTPAuthorizationCredentials = Depends(security),
+        db: DbSession = Depends(get_session)
+) -> schemas.Principal:
+    credentials_exception = _credentials_exception()
+    token_data = decode_token(credentials.credentials, ACCESS)
 
-    user = crud.get_user_by_id(db, user_id=token_data.user_id)
+    if token_data.version is not None:
+        if revocations.is_revoked(token_data.user_id, token_data.version):
+            raise credentials_exception
+        # Воркер знает все отзывы за время жизни токена: пользователь существует,
+        # активен и роль не менялась - БД не нужна
+        if settings.AUTH_STATELESS and token_data.role is not None and revocations.complete():
+            return schemas.Principal(
+                id=token_data.user_id,
+                username=token_data.username,
+                role=token_data.role,
+                token_version=token_data.version
+            )
+
+    user = principal_cache.get(token_data.user_id)
     if user is None:
+        generation = principal_cache.generation
+        db_user = await dal.get_user_by_id(db, user_id=token_data.user_id)
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.Principal.model_validate(db_user)
+        if user.is_active:
+            principal_cache.set(user.id, user, generation=generation)
+
+    if (token_data.version or 0) < user.token_version:
         raise credentials_exception
+
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
 
@@ -67,15 +112,15 @@ async def get_current_user(
 
 
 async def get_current_active_user(
-        current_user: schemas.UserInDB = Depends(get_current_user),
-) -> schemas.UserInDB:
+        current_user: schemas.Principal = Depends(get_current_user),
+) -> schemas.Principal:
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 
 def check_user_permission(
-        current_user: schemas.UserInDB,
+        current_user: schemas.Principal,
         required_role: Optional[schemas.UserRole] = None,
         user_id: Optional[int] = None
 ):
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, NamedTuple, Optional
+from app.config import settings
+
+_registry: Dict[str, "TTLCache"] = {}
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+
+
+class CachedPage(NamedTuple):
+    body: bytes
+    next_cursor: Optional[str]
+
+
+class TTLCache:
+    # Ограниченный LRU-кэш с временем жизни записей, потокобезопасный.
+    # Лимит - по числу записей (maxsize) и, если задан sizeof, по байтам (max_bytes)
+    def __init__(
+            self,
+            name: str,
+            maxsize: int,
+            ttl: float,
+            max_bytes: Optional[int] = None,
+            sizeof: Optional[Callable[[Any], int]] = None
+    ):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        # Меняется при каждой инвалидации: значение, прочитанное из БД
+        # до инвалидации, не должно попасть в кэш после нее
+        self.generation = 0
+        # Время последней инвалидации (time.monotonic)
+        self.invalidated_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        _registry[name] = self
+
+    def _size(self, value: Any) -> int:
+        return self.sizeof(value) if self.sizeof else 0
+
+    def _pop(self, key: Hashable, last: Optional[bool] = None):
+        if last is None:
+            _, value = self._data.pop(key)
+        else:
+            key, (_, value) = self._data.popitem(last=last)
+        self.bytes -= self._size(value)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                self._pop(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        if self.maxsize <= 0:
+            return
+        size = self._size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self.bytes += size
+            while len(self._data) > self.maxsize or (
+                    self.max_bytes is not None and self.bytes > self.max_bytes
+            ):
+                self._pop(None, last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            self.generation += 1
+            self.invalidated_at = time.monotonic()
+            if key in self._data:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self.invalidated_at = time.monotonic()
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in _registry.items()}
+
+
+# Активные пользователи для get_current_user (ключ - user_id)
+principal_cache = TTLCache(
+    "principals",
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL
+)
+
+# Сериализованные ответы GET /advertisement/{id} (ключ - id объявления)
+advertisement_cache = TTLCache(
+    "advertisements",
+    maxsize=settings.AD_CACHE_SIZE,
+    ttl=settings.AD_CACHE_TTL,
+    max_bytes=settings.AD_CACHE_MAX_BYTES,
+    sizeof=lambda entry: len(entry.body)
+)
+
+# Страницы GET /advertisement (ключ - нормализованные фильтры/сортировка/страница)
+search_cache = TTLCache(
+    "searches",
+    maxsize=settings.SEARCH_CACHE_SIZE,
+    ttl=settings.SEARCH_CACHE_TTL,
+    max_bytes=settings.SEARCH_CACHE_MAX_BYTES,
+    sizeof=lambda entry: len(entry.body)
+)
+
+
+def invalidate_advertisement(*advertisement_ids: int):
+    # Любая запись объявлений меняет поколение кэша поиска
+    for advertisement_id in advertisement_ids:
+        advertisement_cache.invalidate(advertisement_id)
+    search_cache.clear()
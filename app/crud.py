@@ -1,17 +1,79 @@
+import io
+import json
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, asc, desc
-from typing import Optional
-from app import models, schemas
-from app.auth import get_password_hash, verify_password
+from sqlalchemy.sql import expression
+from sqlalchemy import (
+    Float, Integer, String, any_, asc, bindparam, case, cast, delete, desc, func, insert, lambda_stmt, literal,
+    literal_column, null, select, text, true, tuple_, type_coerce, union_all, update
+)
+from typing import Dict, List, Optional, Tuple, Any
+from app import adindex, events, models, revocations, schemas, search
+from app.config import settings
+from app.cache import invalidate_advertisement, principal_cache
+from app.hashing import get_password_hash, verify_and_update_password
 
 
 # User CRUD
+# lambda_stmt: запрос строится и получает ключ кэша компиляции один раз,
+# при следующих вызовах подставляется только значение параметра
+def user_by_username_statement(username: str):
+    return lambda_stmt(lambda: select(models.User).where(models.User.username == username))
+
+
+def user_by_id_statement(user_id: int):
+    return lambda_stmt(lambda: select(models.User).where(models.User.id == user_id))
+
+
+def advertisement_by_id_statement(advertisement_id: int):
+    return lambda_stmt(lambda: select(models.Advertisement).where(models.Advertisement.id == advertisement_id))
+
+
+# Выборка по списку id одним запросом. На PostgreSQL - id = ANY(:ids): один
+# параметр-массив, текст запроса (и подготовленный запрос asyncpg) не зависит
+# от числа id; на остальных БД - IN с расширяемым параметром
+_by_ids_statements: Dict[tuple, Any] = {}
+
+
+def by_ids_statement(db, table, columns: Optional[Tuple[str, ...]] = None):
+    key = (db.get_bind().dialect.name, table.name, columns)
+    statement = _by_ids_statements.get(key)
+    if statement is None:
+        if key[0] == "postgresql":
+            condition = table.c.id == any_(bindparam("ids", type_=postgresql.ARRAY(Integer)))
+        else:
+            condition = table.c.id.in_(bindparam("ids", expanding=True))
+        selected = [table.c[column] for column in columns] if columns else table.c
+        statement = _by_ids_statements[key] = select(*selected).where(condition)
+    return statement
+
+
+def order_by_ids(rows, ids: List[int]) -> list:
+    # Строки в порядке запрошенных id; отсутствующих id нет в результате
+    by_id = {row.id: row for row in rows}
+    return [by_id[row_id] for row_id in ids if row_id in by_id]
+
+
+USER_BATCH_COLUMNS = tuple(schemas.UserPublic.model_fields)
+
+
+def get_users_by_ids(db: Session, user_ids: List[int]):
+    # Без hashed_password: только поля ответа
+    statement = by_ids_statement(db, models.User.__table__, USER_BATCH_COLUMNS)
+    return order_by_ids(db.execute(statement, {"ids": user_ids}).all(), user_ids)
+
+
+def get_advertisements_by_ids(db: Session, advertisement_ids: List[int]):
+    statement = by_ids_statement(db, models.Advertisement.__table__)
+    return order_by_ids(db.execute(statement, {"ids": advertisement_ids}).all(), advertisement_ids)
+
+
 def get_user_by_username(db: Session, username: str):
-    return db.query(models.User).filter(models.User.username == username).first()
+    return db.execute(user_by_username_statement(username)).scalars().first()
 
 
 def get_user_by_id(db: Session, user_id: int):
-    return db.query(models.User).filter(models.User.id == user_id).first()
+    return db.execute(user_by_id_statement(user_id)).scalars().first()
 
 
 def create_user(db: Session, user: schemas.UserCreate):
@@ -28,75 +90,461 @@ def create_user(db: Session, user: schemas.UserCreate):
     return db_user
 
 
-def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
-    db_user = get_user_by_id(db, user_id)
-    if db_user:
-        update_data = user_update.model_dump(exclude_unset=True)
+# Смена этих полей делает недействительными выданные пользователю токены
+TOKEN_VERSION_FIELDS = ("hashed_password", "is_active", "role")
 
-        if "password" in update_data:
-            update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
 
-        for key, value in update_data.items():
-            setattr(db_user, key, value)
+def user_update_values(user_update: schemas.UserUpdate, hashed_password: Optional[str] = None) -> dict:
+    update_data = user_update.model_dump(exclude_unset=True)
+    update_data.pop("password", None)
+    if hashed_password is not None:
+        update_data["hashed_password"] = hashed_password
+    if any(field in update_data for field in TOKEN_VERSION_FIELDS):
+        update_data["token_version"] = models.User.__table__.c.token_version + 1
+    return update_data
 
-        db.commit()
-        db.refresh(db_user)
+
+def update_user_statement(user_id: int, values: dict):
+    # Один запрос: UPDATE ... RETURNING вместо SELECT + UPDATE + refresh
+    users = models.User.__table__
+    if not values:
+        return select(*users.c).where(users.c.id == user_id)
+    return update(users).where(users.c.id == user_id).values(**values).returning(*users.c)
+
+
+def delete_user_statement(user_id: int):
+    users = models.User.__table__
+    return delete(users).where(users.c.id == user_id).returning(users.c.id)
+
+
+def update_user(db: Session, user_id: int, user_update: schemas.UserUpdate):
+    # Хэш считается до запроса, чтобы строка не была заблокирована на время bcrypt
+    hashed_password = get_password_hash(user_update.password) if user_update.password else None
+    values = user_update_values(user_update, hashed_password)
+    db_user = db.execute(update_user_statement(user_id, values)).first()
+    revoked = db_user is not None and "token_version" in values
+    if revoked:
+        revocations.publish(db, user_id, db_user.token_version)
+    db.commit()
+    if db_user is not None:
+        principal_cache.invalidate(user_id)
+    if revoked:
+        revocations.apply(user_id, db_user.token_version)
     return db_user
 
 
 def delete_user(db: Session, user_id: int):
-    db_user = get_user_by_id(db, user_id)
-    if db_user:
-        db.delete(db_user)
+    deleted = db.execute(delete_user_statement(user_id)).first()
+    if deleted is None:
         db.commit()
-        return True
-    return False
+        return False
+    revocations.publish(db, user_id, revocations.DELETED_VERSION)
+    db.commit()
+    principal_cache.invalidate(user_id)
+    revocations.apply(user_id, revocations.DELETED_VERSION)
+    return True
 
 
 def authenticate_user(db: Session, username: str, password: str):
     user = get_user_by_username(db, username)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    verified, new_hash = verify_and_update_password(password, user.hashed_password)
+    if not verified:
         return False
+    # Схема или стоимость хэша изменились - перехэшируем при входе
+    if new_hash:
+        user.hashed_password = new_hash
+        db.commit()
+        db.refresh(user)
     return user
 
 
+def create_advertisement_statement(advertisement: schemas.AdvertisementCreate, owner_id: Optional[int]):
+    # INSERT ... RETURNING: строка с created_at без refresh после commit
+    advertisements = models.Advertisement.__table__
+    return insert(advertisements).values(**advertisement.model_dump(), owner_id=owner_id).returning(*advertisements.c)
+
+
 def create_advertisement(db: Session, advertisement: schemas.AdvertisementCreate, owner_id: Optional[int] = None):
-    db_advertisement = models.Advertisement(**advertisement.model_dump())
-    if owner_id:
-        db_advertisement.owner_id = owner_id
-    db.add(db_advertisement)
+    db_advertisement = db.execute(create_advertisement_statement(advertisement, owner_id)).one()
+    events.publish(db, events.CREATED, [db_advertisement])
     db.commit()
-    db.refresh(db_advertisement)
+    invalidate_advertisement()
+    adindex.changed([db_advertisement])
     return db_advertisement
 
 
 def get_advertisement(db: Session, advertisement_id: int):
-    return db.query(models.Advertisement).filter(models.Advertisement.id == advertisement_id).first()
+    return db.execute(advertisement_by_id_statement(advertisement_id)).scalars().first()
+
 
+def _owned_advertisement_filter(advertisement_id: int, owner_id: int, is_admin: bool):
+    advertisements = models.Advertisement.__table__
+    conditions = [advertisements.c.id == advertisement_id]
+    if not is_admin:
+        conditions.append(advertisements.c.owner_id == owner_id)
+    return conditions
 
-def update_advertisement(db: Session, advertisement_id: int, advertisement_update: schemas.AdvertisementUpdate):
-    db_advertisement = get_advertisement(db, advertisement_id)
-    if db_advertisement:
-        update_data = advertisement_update.model_dump(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(db_advertisement, key, value)
+
+def update_advertisement_statement(advertisement_id: int, values: dict, owner_id: int, is_admin: bool):
+    # Проверка владельца - в WHERE того же UPDATE ... RETURNING
+    advertisements = models.Advertisement.__table__
+    conditions = _owned_advertisement_filter(advertisement_id, owner_id, is_admin)
+    if not values:
+        return select(*advertisements.c).where(*conditions)
+    return update(advertisements).where(*conditions).values(**values).returning(*advertisements.c)
+
+
+def delete_advertisement_statement(advertisement_id: int, owner_id: int, is_admin: bool):
+    advertisements = models.Advertisement.__table__
+    return (
+        delete(advertisements)
+        .where(*_owned_advertisement_filter(advertisement_id, owner_id, is_admin))
+        .returning(*advertisements.c)
+    )
+
+
+def advertisement_exists_statement(advertisement_id: int):
+    return select(literal(1)).where(models.Advertisement.__table__.c.id == advertisement_id)
+
+
+def advertisements_by_ids_statement(advertisement_ids):
+    advertisements = models.Advertisement.__table__
+    return select(*advertisements.c).where(advertisements.c.id.in_(advertisement_ids))
+
+
+def update_advertisement(
+        db: Session,
+        advertisement_id: int,
+        advertisement_update: schemas.AdvertisementUpdate,
+        owner_id: int,
+        is_admin: bool = False
+) -> Tuple[schemas.BulkItemStatus, Any]:
+    values = advertisement_update.model_dump(exclude_unset=True)
+    db_advertisement = db.execute(
+        update_advertisement_statement(advertisement_id, values, owner_id, is_admin)
+    ).first()
+    if db_advertisement is None:
+        # Ничего не изменено: второй запрос только чтобы отличить 404 от 403
+        exists = db.execute(advertisement_exists_statement(advertisement_id)).first() is not None
         db.commit()
-        db.refresh(db_advertisement)
-    return db_advertisement
+        return schemas.BulkItemStatus.FORBIDDEN if exists else schemas.BulkItemStatus.NOT_FOUND, None
+    if values:
+        events.publish(db, events.UPDATED, [db_advertisement])
+    db.commit()
+    if values:
+        invalidate_advertisement(advertisement_id)
+        adindex.changed([db_advertisement])
+    return schemas.BulkItemStatus.UPDATED, db_advertisement
 
 
-def delete_advertisement(db: Session, advertisement_id: int):
-    db_advertisement = get_advertisement(db, advertisement_id)
-    if db_advertisement:
-        db.delete(db_advertisement)
+def delete_advertisement(
+        db: Session,
+        advertisement_id: int,
+        owner_id: int,
+        is_admin: bool = False
+) -> schemas.BulkItemStatus:
+    deleted = db.execute(delete_advertisement_statement(advertisement_id, owner_id, is_admin)).first()
+    if deleted is None:
+        exists = db.execute(advertisement_exists_statement(advertisement_id)).first() is not None
         db.commit()
-        return True
-    return False
+        return schemas.BulkItemStatus.FORBIDDEN if exists else schemas.BulkItemStatus.NOT_FOUND
+    events.publish(db, events.DELETED, [deleted])
+    db.commit()
+    invalidate_advertisement(advertisement_id)
+    adindex.deleted([advertisement_id])
+    return schemas.BulkItemStatus.DELETED
+
+
+# Bulk
+BULK_COLUMNS = ("title", "description", "price", "author", "owner_id")
+# Строк в одном UPDATE ... FROM (VALUES ...): параметров меньше предела asyncpg (32767)
+BULK_UPDATE_CHUNK_SIZE = 1000
+
+
+def bulk_rows(advertisements: List[schemas.AdvertisementCreate], owner_id: Optional[int]) -> List[dict]:
+    return [dict(advertisement.model_dump(), owner_id=owner_id) for advertisement in advertisements]
+
+
+def bulk_insert_statement():
+    # Многострочный INSERT ... RETURNING с сохранением порядка строк; строки целиком
+    # нужны уведомлениям и индексу, повторно их не читаем
+    advertisements = models.Advertisement.__table__
+    return insert(models.Advertisement).returning(*advertisements.c, sort_by_parameter_order=True)
+
+
+def bulk_update_statements(db, params: List[dict]) -> list:
+    # UPDATE ... RETURNING вместо повторного чтения строк. PostgreSQL - одно
+    # UPDATE ... FROM (VALUES ...) на группу строк с одинаковым набором полей;
+    # остальные БД (SQLite не поддерживает имена колонок у VALUES) - по строке
+    advertisements = models.Advertisement.__table__
+    if db.get_bind().dialect.name != "postgresql":
+        return [
+            update(advertisements)
+            .where(advertisements.c.id == row["id"])
+            .values({field: value for field, value in row.items() if field != "id"})
+            .returning(*advertisements.c)
+            for row in params
+        ]
+
+    # Повторный id - в следующий проход: изменения одного объявления применяются
+    # в порядке запроса, как при executemany
+    rounds: List[Dict[Tuple[str, ...], List[dict]]] = []
+    occurrences: Dict[int, int] = {}
+    for row in params:
+        number = occurrences.get(row["id"], 0)
+        occurrences[row["id"]] = number + 1
+        if number == len(rounds):
+            rounds.append({})
+        fields = tuple(sorted(field for field in row if field != "id"))
+        rounds[number].setdefault(fields, []).append(row)
+    statements = []
+    for fields, rows in (group for groups in rounds for group in groups.items()):
+        for start in range(0, len(rows), BULK_UPDATE_CHUNK_SIZE):
+            data = expression.values(
+                expression.column("id", Integer),
+                *(expression.column(field, advertisements.c[field].type) for field in fields),
+                name="bulk"
+            ).data([
+                (row["id"], *(row[field] for field in fields))
+                for row in rows[start:start + BULK_UPDATE_CHUNK_SIZE]
+            ])
+            statements.append(
+                update(advertisements)
+                .where(advertisements.c.id == data.c.id)
+                .values({field: data.c[field] for field in fields})
+                .returning(*advertisements.c)
+            )
+    return statements
+
+
+def reserve_advertisement_ids_statement(count: int):
+    return select(
+        func.nextval(func.pg_get_serial_sequence("advertisements", "id"))
+    ).select_from(func.generate_series(1, count))
+
+
+def _copy_text_value(value) -> str:
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_advertisements(db: Session, rows: List[dict]) -> List[int]:
+    # Для больших пакетов: резервируем id из sequence и грузим строки через COPY
+    ids = list(db.execute(reserve_advertisement_ids_statement(len(rows))).scalars())
+    buffer = io.StringIO()
+    for advertisement_id, row in zip(ids, rows):
+        values = [advertisement_id] + [row[column] for column in BULK_COLUMNS]
+        buffer.write("\t".join(_copy_text_value(value) for value in values) + "\n")
+    buffer.seek(0)
+
+    cursor = db.connection().connection.dbapi_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY advertisements (id, {', '.join(BULK_COLUMNS)}) FROM STDIN",
+            buffer
+        )
+    finally:
+        cursor.close()
+    return ids
+
+
+def use_copy(db, count: int) -> bool:
+    return count >= settings.BULK_COPY_THRESHOLD and db.get_bind().dialect.name == "postgresql"
+
+
+def bulk_create_results(ids: List[int]) -> List[schemas.BulkItemResult]:
+    return [
+        schemas.BulkItemResult(index=index, id=advertisement_id, status=schemas.BulkItemStatus.CREATED)
+        for index, advertisement_id in enumerate(ids)
+    ]
+
+
+def bulk_owned_statement(advertisement_ids: List[int]):
+    # Блокируем строки до конца транзакции, чтобы проверка владельца не устарела
+    return (
+        select(models.Advertisement.id, models.Advertisement.owner_id)
+        .where(models.Advertisement.id.in_(set(advertisement_ids)))
+        .with_for_update()
+    )
+
+
+def bulk_delete_statement(advertisement_ids):
+    advertisements = models.Advertisement.__table__
+    return delete(advertisements).where(advertisements.c.id.in_(advertisement_ids)).returning(*advertisements.c)
 
 
-def search_advertisements(
+def bulk_check_owners(
+        advertisement_ids: List[int],
+        owners: Dict[int, Optional[int]],
+        owner_id: int,
+        is_admin: bool,
+        ok_status: schemas.BulkItemStatus
+) -> List[schemas.BulkItemResult]:
+    results = []
+    for index, advertisement_id in enumerate(advertisement_ids):
+        if advertisement_id not in owners:
+            status = schemas.BulkItemStatus.NOT_FOUND
+        elif not is_admin and owners[advertisement_id] != owner_id:
+            status = schemas.BulkItemStatus.FORBIDDEN
+        else:
+            status = ok_status
+        results.append(schemas.BulkItemResult(index=index, id=advertisement_id, status=status))
+    return results
+
+
+def bulk_create_advertisements(
+        db: Session,
+        advertisements: List[schemas.AdvertisementCreate],
+        owner_id: Optional[int] = None
+) -> List[schemas.BulkItemResult]:
+    rows = bulk_rows(advertisements, owner_id)
+    if use_copy(db, len(rows)) and db.get_bind().dialect.driver == "psycopg2":
+        ids = _copy_advertisements(db, rows)
+        # COPY строк не возвращает, а уведомлениям (PostgreSQL) они нужны
+        created = db.execute(advertisements_by_ids_statement(ids)).all()
+    else:
+        created = db.execute(bulk_insert_statement(), rows).all()
+        ids = [row.id for row in created]
+    events.publish(db, events.CREATED, created)
+    db.commit()
+    invalidate_advertisement()
+    adindex.changed(created)
+    return bulk_create_results(ids)
+
+
+def bulk_update_advertisements(
+        db: Session,
+        items: List[schemas.AdvertisementBulkUpdateItem],
+        owner_id: int,
+        is_admin: bool = False
+) -> List[schemas.BulkItemResult]:
+    advertisement_ids = [item.id for item in items]
+    owners = dict(db.execute(bulk_owned_statement(advertisement_ids)).all())
+    results = bulk_check_owners(advertisement_ids, owners, owner_id, is_admin, schemas.BulkItemStatus.UPDATED)
+
+    params = [
+        dict(item.model_dump(exclude_unset=True, exclude={"id"}), id=item.id)
+        for item, result in zip(items, results)
+        if result.status == schemas.BulkItemStatus.UPDATED and item.model_fields_set - {"id"}
+    ]
+    updated = [row for statement in bulk_update_statements(db, params) for row in db.execute(statement).all()]
+    events.publish(db, events.UPDATED, updated)
+    db.commit()
+    invalidate_advertisement(*(row["id"] for row in params))
+    adindex.changed(updated)
+    return results
+
+
+def bulk_delete_advertisements(
+        db: Session,
+        advertisement_ids: List[int],
+        owner_id: int,
+        is_admin: bool = False
+) -> List[schemas.BulkItemResult]:
+    owners = dict(db.execute(bulk_owned_statement(advertisement_ids)).all())
+    results = bulk_check_owners(advertisement_ids, owners, owner_id, is_admin, schemas.BulkItemStatus.DELETED)
+
+    allowed = {result.id for result in results if result.status == schemas.BulkItemStatus.DELETED}
+    if allowed:
+        deleted = db.execute(bulk_delete_statement(allowed)).all()
+        events.publish(db, events.DELETED, deleted)
+    db.commit()
+    invalidate_advertisement(*allowed)
+    adindex.deleted(allowed)
+    return results
+
+
+# Готовые select() поиска по "форме" запроса: какие фильтры заданы, сортировка,
+# курсор. Значения фильтров - связанные параметры, поэтому запрос не строится
+# заново и ключ кэша компиляции не вычисляется на каждый вызов
+_search_statements: Dict[tuple, Any] = {}
+
+
+def _sort_column(dialect: str, sort_by: str):
+    column = getattr(models.Advertisement, sort_by, models.Advertisement.created_at)
+    if dialect == "sqlite" and column is models.Advertisement.created_at:
+        # SQLite хранит дату строкой: server_default (CURRENT_TIMESTAMP) - без долей
+        # секунды, SQLAlchemy - с микросекундами. Курсор сравнивается строкой, поэтому
+        # сортировка и сравнение идут по значению, дополненному до формата SQLAlchemy
+        padded = column.op("||")(func.substr(".000000", func.length(column) - 18))
+        return type_coerce(padded, column.type)
+    return column
+
+
+def _build_search_statement(
+        dialect: str,
+        fulltext: bool,
+        title: bool,
+        author: bool,
+        description: bool,
+        min_price: bool,
+        max_price: bool,
+        search_text: bool,
+        sort_by: str,
+        sort_order: str,
+        after: bool,
+        skip: bool,
+        limit: bool,
+        columns: Optional[Tuple[str, ...]]
+):
+    query = select(models.Advertisement)
+
+    if title:
+        query = query.filter(models.Advertisement.title.ilike(bindparam("title_pattern", type_=String)))
+
+    if author:
+        query = query.filter(models.Advertisement.author.ilike(bindparam("author_pattern", type_=String)))
+
+    if description:
+        query = query.filter(models.Advertisement.description.ilike(bindparam("description_pattern", type_=String)))
+
+    if min_price:
+        query = query.filter(models.Advertisement.price >= bindparam("min_price", type_=Float))
+
+    if max_price:
+        query = query.filter(models.Advertisement.price <= bindparam("max_price", type_=Float))
+
+    if search_text:
+        query = query.filter(search.text_filter(fulltext))
+
+    # Сортировка (id - для стабильного порядка при равных значениях)
+    if sort_by == "relevance" and search_text:
+        sort_column = search.relevance(fulltext)
+    else:
+        sort_column = _sort_column(dialect, sort_by)
+    seek_key = tuple_(sort_column, models.Advertisement.id)
+    after_key = tuple_(bindparam("after_value", type_=sort_column.type), bindparam("after_id", type_=Integer))
+    if sort_order == "asc":
+        if after:
+            query = query.filter(seek_key > after_key)
+        query = query.order_by(asc(sort_column), asc(models.Advertisement.id))
+    else:
+        if after:
+            query = query.filter(seek_key < after_key)
+        query = query.order_by(desc(sort_column), desc(models.Advertisement.id))
+
+    # Keyset-пагинация: при курсоре offset не нужен
+    if skip:
+        query = query.offset(bindparam("skip", type_=Integer))
+
+    if limit:
+        query = query.limit(bindparam("limit", type_=Integer))
+
+    if columns:
+        query = query.with_only_columns(*(getattr(models.Advertisement, column) for column in columns))
+    return query
+
+
+def search_advertisements_statement(
         db: Session,
         title: Optional[str] = None,
         author: Optional[str] = None,
@@ -105,44 +553,223 @@ def search_advertisements(
         max_price: Optional[float] = None,
         search_text: Optional[str] = None,
         skip: int = 0,
-        limit: int = 100,
+        limit: Optional[int] = 100,
         sort_by: str = "created_at",
-        sort_order: str = "desc"
-):
-    query = db.query(models.Advertisement)
+        sort_order: str = "desc",
+        after: Optional[Tuple[Any, int]] = None,
+        columns: Optional[Tuple[str, ...]] = None
+) -> Tuple[Any, dict]:
+    # (готовый запрос, значения параметров) для db.execute(statement, values)
+    fulltext = bool(search_text) and search.use_fulltext(db)
+    sort_order = sort_order.lower()
+    shape = (
+        db.get_bind().dialect.name, fulltext, bool(title), bool(author), bool(description),
+        min_price is not None, max_price is not None, bool(search_text), sort_by, sort_order,
+        after is not None, after is None and bool(skip), limit is not None, columns
+    )
+    statement = _search_statements.get(shape)
+    if statement is None:
+        statement = _search_statements[shape] = _build_search_statement(*shape)
+
+    values = {"min_price": min_price, "max_price": max_price, "skip": skip, "limit": limit}
+    for name, value in (("title", title), ("author", author), ("description", description)):
+        if value:
+            values[f"{name}_pattern"] = f"%{value}%"
+    if search_text:
+        values.update(search.search_params(fulltext, search_text))
+    if after is not None:
+        values["after_value"], values["after_id"] = after
+    return statement, values
 
-    if title:
-        query = query.filter(models.Advertisement.title.ilike(f"%{title}%"))
 
-    if author:
-        query = query.filter(models.Advertisement.author.ilike(f"%{author}%"))
+def search_advertisements_query(db: Session, **params):
+    # Самостоятельный запрос со значениями (для агрегатов и экспорта, которые его достраивают)
+    statement, values = search_advertisements_statement(db, **params)
+    return statement.params(values)
 
-    if description:
-        query = query.filter(models.Advertisement.description.ilike(f"%{description}%"))
 
-    if min_price is not None:
-        query = query.filter(models.Advertisement.price >= min_price)
+def _indexed_search(db: Session, columns: Optional[Tuple[str, ...]], params: dict):
+    # Индекс в памяти выбирает id страницы, из БД читаются только эти строки
+    ids = adindex.advertisement_index.search(columns=columns, **params) if adindex.enabled() else None
+    if not ids:
+        return ids
+    rows = db.execute(by_ids_statement(db, models.Advertisement.__table__, columns), {"ids": ids}).all()
+    return adindex.advertisement_index.page(rows, ids, **params)
 
-    if max_price is not None:
-        query = query.filter(models.Advertisement.price <= max_price)
 
-    if search_text:
-        query = query.filter(
-            or_(
-                models.Advertisement.title.ilike(f"%{search_text}%"),
-                models.Advertisement.description.ilike(f"%{search_text}%"),
-                models.Advertisement.author.ilike(f"%{search_text}%")
-            )
-        )
+def search_advertisements(db: Session, **params):
+    page = _indexed_search(db, None, params)
+    if page is not None:
+        return page
+    statement, values = search_advertisements_statement(db, **params)
+    return db.execute(statement, values).scalars().all()
+
+
+def search_advertisement_rows(db: Session, columns: Tuple[str, ...], **params):
+    # Плоские строки без ORM-объектов
+    page = _indexed_search(db, columns, params)
+    if page is not None:
+        return page
+    statement, values = search_advertisements_statement(db, columns=columns, **params)
+    return db.execute(statement, values).all()
+
+
+# Facets
+TABLE_ROWS_ESTIMATE = text(
+    "SELECT reltuples::bigint FROM pg_class WHERE oid = 'advertisements'::regclass"
+)
+
+# TID-выборка: читаются только страницы из TABLESAMPLE, а не вся таблица
+SAMPLE_FILTER = text(
+    "advertisements.ctid = ANY(ARRAY("
+    "SELECT ctid FROM advertisements TABLESAMPLE SYSTEM (:sample_percent)))"
+).bindparams(bindparam("sample_percent", type_=Float))
+
+
+def _filters_query(db, filters: dict):
+    return search_advertisements_query(db, limit=None, **filters).order_by(None)
 
-    # Сортировка
-    sort_column = getattr(models.Advertisement, sort_by, models.Advertisement.created_at)
-    if sort_order.lower() == "asc":
-        query = query.order_by(asc(sort_column))
-    else:
-        query = query.order_by(desc(sort_column))
 
-    return query.offset(skip).limit(limit).all()
+def facets_query(db, buckets: int, top_authors: int, sample_percent=None, **filters):
+    base = _filters_query(db, filters).with_only_columns(
+        models.Advertisement.price, models.Advertisement.author
+    )
+    if sample_percent is not None:
+        base = base.where(SAMPLE_FILTER.bindparams(sample_percent=sample_percent))
+    filtered = base.cte("filtered")
+
+    stats = select(
+        func.count().label("total"),
+        func.min(filtered.c.price).label("lo"),
+        func.max(filtered.c.price).label("hi")
+    ).cte("stats")
+
+    width = stats.c.hi - stats.c.lo
+    position = (filtered.c.price - stats.c.lo) * buckets / width
+    # PostgreSQL округляет при приведении к integer, SQLite отбрасывает дробную часть
+    if db.get_bind().dialect.name == "postgresql":
+        position = func.floor(position)
+    position = cast(position, Integer)
+    bucket = case((width == 0, 0), (position >= buckets, buckets - 1), else_=position)
+    histogram = (
+        select(bucket.label("bucket"), func.count().label("count"))
+        .select_from(filtered)
+        .join(stats, true())
+        .group_by(bucket)
+        .cte("histogram")
+    )
+
+    authors = (
+        select(filtered.c.author, func.count().label("count"))
+        .group_by(filtered.c.author)
+        .order_by(desc("count"), filtered.c.author)
+        .limit(top_authors)
+        .cte("authors")
+    )
+
+    # Один запрос: строки stats / bucket / author
+    return union_all(
+        select(literal("stats").label("kind"), cast(null(), String).label("author"),
+               cast(null(), Integer).label("bucket"), stats.c.total.label("count"),
+               stats.c.lo, stats.c.hi),
+        select(literal("bucket"), cast(null(), String), histogram.c.bucket, histogram.c.count,
+               cast(null(), Float), cast(null(), Float)),
+        select(literal("author"), authors.c.author, cast(null(), Integer), authors.c.count,
+               cast(null(), Float), cast(null(), Float)),
+    )
+
+
+def explain_rows_sql(db, filters: dict) -> str:
+    # Оценка планировщика для числа строк с фильтрами
+    query = _filters_query(db, filters).with_only_columns(literal_column("1"))
+    compiled = query.compile(dialect=db.get_bind().dialect, compile_kwargs={"literal_binds": True})
+    return f"EXPLAIN (FORMAT JSON) {compiled}"
+
+
+def parse_explain_rows(plan) -> int:
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def facets_sample_percent(table_rows: Optional[int]) -> Optional[float]:
+    if table_rows is None or table_rows <= settings.FACETS_SAMPLE_ROWS:
+        return None
+    return 100.0 * settings.FACETS_SAMPLE_ROWS / table_rows
+
+
+def build_facets(rows, buckets: int, sample_percent=None, estimate=None) -> schemas.AdvertisementFacets:
+    scale = 100.0 / sample_percent if sample_percent else 1.0
+    total, lo, hi = 0, None, None
+    counts = [0] * buckets
+    top_authors = []
+    for kind, author, bucket, count, row_lo, row_hi in rows:
+        if kind == "stats":
+            total, lo, hi = count, row_lo, row_hi
+        elif kind == "bucket" and bucket is not None:
+            counts[bucket] = round(count * scale)
+        elif kind == "author":
+            top_authors.append(schemas.AuthorCount(author=author, count=round(count * scale)))
+
+    histogram = []
+    if lo is not None:
+        width = (hi - lo) / buckets
+        histogram = [
+            schemas.PriceBucket(min_price=lo + width * index, max_price=lo + width * (index + 1), count=count)
+            for index, count in enumerate(counts)
+        ]
+
+    return schemas.AdvertisementFacets(
+        total=estimate if estimate is not None else round(total * scale),
+        approximate=estimate is not None or sample_percent is not None,
+        min_price=lo,
+        max_price=hi,
+        price_histogram=histogram,
+        top_authors=top_authors
+    )
+
+
+def advertisement_facets(
+        db: Session,
+        buckets: int = 10,
+        top_authors: int = 10,
+        approximate: bool = False,
+        **filters
+) -> schemas.AdvertisementFacets:
+    sample_percent, estimate = None, None
+    if approximate and db.get_bind().dialect.name == "postgresql":
+        table_rows = db.execute(TABLE_ROWS_ESTIMATE).scalar()
+        # Небольшие (или еще не анализированные) таблицы считаем точно
+        sample_percent = facets_sample_percent(table_rows)
+        if sample_percent is not None:
+            if any(value is not None for value in filters.values()):
+                plan = db.connection().exec_driver_sql(explain_rows_sql(db, filters)).scalar()
+                estimate = parse_explain_rows(plan)
+            else:
+                estimate = table_rows
+
+    rows = db.execute(facets_query(db, buckets, top_authors, sample_percent, **filters)).all()
+    return build_facets(rows, buckets, sample_percent, estimate)
+
+
+EXPORT_COLUMNS = ("id", "title", "description", "price", "author", "owner_id", "created_at")
+
+
+def export_advertisements_query(db: Session, **params):
+    # Только нужные колонки, без лимита: читается серверным курсором
+    query = search_advertisements_query(db, limit=None, **params)
+    return query.with_only_columns(
+        *(getattr(models.Advertisement, column) for column in EXPORT_COLUMNS)
+    )
+
+
+def iter_advertisement_rows(db: Session, chunk_size: int, **params):
+    result = db.execute(
+        export_advertisements_query(db, **params),
+        execution_options={"yield_per": chunk_size}
+    )
+    for partition in result.partitions():
+        yield partition
 
 
 def get_advertisements(db: Session, skip: int = 0, limit: int = 100):
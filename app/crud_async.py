@@ -0,0 +1,295 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import Any, List, Optional, Tuple
+from app import adindex, events, models, revocations, schemas
+from app.cache import invalidate_advertisement, principal_cache
+from app.hashing import get_password_hash_async, verify_and_update_password_async
+from app.crud import (
+    BULK_COLUMNS, TABLE_ROWS_ESTIMATE, USER_BATCH_COLUMNS, advertisement_by_id_statement,
+    advertisement_exists_statement, advertisements_by_ids_statement, build_facets, bulk_check_owners,
+    bulk_create_results, bulk_delete_statement, bulk_insert_statement, bulk_owned_statement, bulk_rows,
+    bulk_update_statements, by_ids_statement, create_advertisement_statement, delete_advertisement_statement,
+    delete_user_statement, explain_rows_sql, export_advertisements_query, facets_query, facets_sample_percent,
+    order_by_ids, parse_explain_rows, reserve_advertisement_ids_statement, search_advertisements_statement,
+    update_advertisement_statement, update_user_statement, use_copy, user_by_id_statement, user_by_username_statement,
+    user_update_values
+)
+
+
+# Асинхронные версии функций app/crud.py (AsyncSession, asyncpg)
+
+# User CRUD
+async def get_user_by_username(db: AsyncSession, username: str):
+    result = await db.execute(user_by_username_statement(username))
+    return result.scalars().first()
+
+
+async def get_user_by_id(db: AsyncSession, user_id: int):
+    result = await db.execute(user_by_id_statement(user_id))
+    return result.scalars().first()
+
+
+async def get_users_by_ids(db: AsyncSession, user_ids: List[int]):
+    statement = by_ids_statement(db, models.User.__table__, USER_BATCH_COLUMNS)
+    return order_by_ids((await db.execute(statement, {"ids": user_ids})).all(), user_ids)
+
+
+async def get_advertisements_by_ids(db: AsyncSession, advertisement_ids: List[int]):
+    statement = by_ids_statement(db, models.Advertisement.__table__)
+    return order_by_ids((await db.execute(statement, {"ids": advertisement_ids})).all(), advertisement_ids)
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    hashed_password = await get_password_hash_async(user.password)
+    db_user = models.User(
+        username=user.username,
+        email=user.email,
+        hashed_password=hashed_password,
+        role=models.UserRole.USER
+    )
+    db.add(db_user)
+    await db.commit()
+    await db.refresh(db_user)
+    return db_user
+
+
+async def update_user(db: AsyncSession, user_id: int, user_update: schemas.UserUpdate):
+    hashed_password = await get_password_hash_async(user_update.password) if user_update.password else None
+    values = user_update_values(user_update, hashed_password)
+    db_user = (await db.execute(update_user_statement(user_id, values))).first()
+    revoked = db_user is not None and "token_version" in values
+    if revoked:
+        await revocations.publish_async(db, user_id, db_user.token_version)
+    await db.commit()
+    if db_user is not None:
+        principal_cache.invalidate(user_id)
+    if revoked:
+        revocations.apply(user_id, db_user.token_version)
+    return db_user
+
+
+async def delete_user(db: AsyncSession, user_id: int):
+    deleted = (await db.execute(delete_user_statement(user_id))).first()
+    if deleted is None:
+        await db.commit()
+        return False
+    await revocations.publish_async(db, user_id, revocations.DELETED_VERSION)
+    await db.commit()
+    principal_cache.invalidate(user_id)
+    revocations.apply(user_id, revocations.DELETED_VERSION)
+    return True
+
+
+async def authenticate_user(db: AsyncSession, username: str, password: str):
+    user = await get_user_by_username(db, username)
+    if not user:
+        return False
+    verified, new_hash = await verify_and_update_password_async(password, user.hashed_password)
+    if not verified:
+        return False
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+        await db.refresh(user)
+    return user
+
+
+async def create_advertisement(
+        db: AsyncSession,
+        advertisement: schemas.AdvertisementCreate,
+        owner_id: Optional[int] = None
+):
+    db_advertisement = (await db.execute(create_advertisement_statement(advertisement, owner_id))).one()
+    await events.publish_async(db, events.CREATED, [db_advertisement])
+    await db.commit()
+    invalidate_advertisement()
+    adindex.changed_later([db_advertisement])
+    return db_advertisement
+
+
+async def get_advertisement(db: AsyncSession, advertisement_id: int):
+    result = await db.execute(advertisement_by_id_statement(advertisement_id))
+    return result.scalars().first()
+
+
+async def update_advertisement(
+        db: AsyncSession,
+        advertisement_id: int,
+        advertisement_update: schemas.AdvertisementUpdate,
+        owner_id: int,
+        is_admin: bool = False
+) -> Tuple[schemas.BulkItemStatus, Any]:
+    values = advertisement_update.model_dump(exclude_unset=True)
+    result = await db.execute(update_advertisement_statement(advertisement_id, values, owner_id, is_admin))
+    db_advertisement = result.first()
+    if db_advertisement is None:
+        exists = (await db.execute(advertisement_exists_statement(advertisement_id))).first() is not None
+        await db.commit()
+        return schemas.BulkItemStatus.FORBIDDEN if exists else schemas.BulkItemStatus.NOT_FOUND, None
+    if values:
+        await events.publish_async(db, events.UPDATED, [db_advertisement])
+    await db.commit()
+    if values:
+        invalidate_advertisement(advertisement_id)
+        adindex.changed_later([db_advertisement])
+    return schemas.BulkItemStatus.UPDATED, db_advertisement
+
+
+async def delete_advertisement(
+        db: AsyncSession,
+        advertisement_id: int,
+        owner_id: int,
+        is_admin: bool = False
+) -> schemas.BulkItemStatus:
+    deleted = (await db.execute(delete_advertisement_statement(advertisement_id, owner_id, is_admin))).first()
+    if deleted is None:
+        exists = (await db.execute(advertisement_exists_statement(advertisement_id))).first() is not None
+        await db.commit()
+        return schemas.BulkItemStatus.FORBIDDEN if exists else schemas.BulkItemStatus.NOT_FOUND
+    await events.publish_async(db, events.DELETED, [deleted])
+    await db.commit()
+    invalidate_advertisement(advertisement_id)
+    adindex.deleted_later([advertisement_id])
+    return schemas.BulkItemStatus.DELETED
+
+
+async def _copy_advertisements(db: AsyncSession, rows: List[dict]) -> List[int]:
+    ids = list((await db.execute(reserve_advertisement_ids_statement(len(rows)))).scalars())
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    await raw_connection.driver_connection.copy_records_to_table(
+        "advertisements",
+        records=[
+            (advertisement_id, *(row[column] for column in BULK_COLUMNS))
+            for advertisement_id, row in zip(ids, rows)
+        ],
+        columns=["id", *BULK_COLUMNS]
+    )
+    return ids
+
+
+async def bulk_create_advertisements(
+        db: AsyncSession,
+        advertisements: List[schemas.AdvertisementCreate],
+        owner_id: Optional[int] = None
+) -> List[schemas.BulkItemResult]:
+    rows = bulk_rows(advertisements, owner_id)
+    if use_copy(db, len(rows)) and db.get_bind().dialect.driver == "asyncpg":
+        ids = await _copy_advertisements(db, rows)
+        created = (await db.execute(advertisements_by_ids_statement(ids))).all()
+    else:
+        created = (await db.execute(bulk_insert_statement(), rows)).all()
+        ids = [row.id for row in created]
+    await events.publish_async(db, events.CREATED, created)
+    await db.commit()
+    invalidate_advertisement()
+    adindex.changed_later(created)
+    return bulk_create_results(ids)
+
+
+async def bulk_update_advertisements(
+        db: AsyncSession,
+        items: List[schemas.AdvertisementBulkUpdateItem],
+        owner_id: int,
+        is_admin: bool = False
+) -> List[schemas.BulkItemResult]:
+    advertisement_ids = [item.id for item in items]
+    owners = dict((await db.execute(bulk_owned_statement(advertisement_ids))).all())
+    results = bulk_check_owners(advertisement_ids, owners, owner_id, is_admin, schemas.BulkItemStatus.UPDATED)
+
+    params = [
+        dict(item.model_dump(exclude_unset=True, exclude={"id"}), id=item.id)
+        for item, result in zip(items, results)
+        if result.status == schemas.BulkItemStatus.UPDATED and item.model_fields_set - {"id"}
+    ]
+    updated = []
+    for statement in bulk_update_statements(db, params):
+        updated += (await db.execute(statement)).all()
+    await events.publish_async(db, events.UPDATED, updated)
+    await db.commit()
+    invalidate_advertisement(*(row["id"] for row in params))
+    adindex.changed_later(updated)
+    return results
+
+
+async def bulk_delete_advertisements(
+        db: AsyncSession,
+        advertisement_ids: List[int],
+        owner_id: int,
+        is_admin: bool = False
+) -> List[schemas.BulkItemResult]:
+    owners = dict((await db.execute(bulk_owned_statement(advertisement_ids))).all())
+    results = bulk_check_owners(advertisement_ids, owners, owner_id, is_admin, schemas.BulkItemStatus.DELETED)
+
+    allowed = {result.id for result in results if result.status == schemas.BulkItemStatus.DELETED}
+    if allowed:
+        deleted = (await db.execute(bulk_delete_statement(allowed))).all()
+        await events.publish_async(db, events.DELETED, deleted)
+    await db.commit()
+    invalidate_advertisement(*allowed)
+    adindex.deleted_later(allowed)
+    return results
+
+
+async def _indexed_search(db: AsyncSession, columns: Optional[Tuple[str, ...]], params: dict):
+    # Поиск в event loop: индекс занят записью - запрос уходит в БД, loop не ждет
+    ids = adindex.advertisement_index.search(columns=columns, wait=False, **params) if adindex.enabled() else None
+    if not ids:
+        return ids
+    statement = by_ids_statement(db, models.Advertisement.__table__, columns)
+    rows = (await db.execute(statement, {"ids": ids})).all()
+    return adindex.advertisement_index.page(rows, ids, **params)
+
+
+async def search_advertisements(db: AsyncSession, **params):
+    page = await _indexed_search(db, None, params)
+    if page is not None:
+        return page
+    statement, values = search_advertisements_statement(db, **params)
+    result = await db.execute(statement, values)
+    return result.scalars().all()
+
+
+async def search_advertisement_rows(db: AsyncSession, columns: Tuple[str, ...], **params):
+    page = await _indexed_search(db, columns, params)
+    if page is not None:
+        return page
+    statement, values = search_advertisements_statement(db, columns=columns, **params)
+    return (await db.execute(statement, values)).all()
+
+
+async def advertisement_facets(
+        db: AsyncSession,
+        buckets: int = 10,
+        top_authors: int = 10,
+        approximate: bool = False,
+        **filters
+) -> schemas.AdvertisementFacets:
+    sample_percent, estimate = None, None
+    if approximate and db.get_bind().dialect.name == "postgresql":
+        table_rows = (await db.execute(TABLE_ROWS_ESTIMATE)).scalar()
+        sample_percent = facets_sample_percent(table_rows)
+        if sample_percent is not None:
+            if any(value is not None for value in filters.values()):
+                connection = await db.connection()
+                plan = (await connection.exec_driver_sql(explain_rows_sql(db, filters))).scalar()
+                estimate = parse_explain_rows(plan)
+            else:
+                estimate = table_rows
+
+    rows = (await db.execute(facets_query(db, buckets, top_authors, sample_percent, **filters))).all()
+    return build_facets(rows, buckets, sample_percent, estimate)
+
+
+async def iter_advertisement_rows(db: AsyncSession, chunk_size: int, **params):
+    result = await db.stream(
+        export_advertisements_query(db, **params),
+        execution_options={"yield_per": chunk_size}
+    )
+    async for partition in result.partitions():
+        yield partition
+
+
+async def get_advertisements(db: AsyncSession, skip: int = 0, limit: int = 100):
+    result = await db.execute(select(models.Advertisement).offset(skip).limit(limit))
+    return result.scalars().all()
@@ -0,0 +1,37 @@
+from functools import wraps
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from app import crud, crud_async
+
+
+# Вызов crud из async-обработчиков: AsyncSession -> app/crud_async.py,
+# Session -> app/crud.py в threadpool (не блокируя event loop)
+def _dispatch(name: str):
+    @wraps(getattr(crud, name))
+    async def call(db, *args, **kwargs):
+        if isinstance(db, AsyncSession):
+            return await getattr(crud_async, name)(db, *args, **kwargs)
+        return await run_in_threadpool(getattr(crud, name), db, *args, **kwargs)
+
+    return call
+
+
+get_user_by_username = _dispatch("get_user_by_username")
+get_user_by_id = _dispatch("get_user_by_id")
+get_users_by_ids = _dispatch("get_users_by_ids")
+create_user = _dispatch("create_user")
+update_user = _dispatch("update_user")
+delete_user = _dispatch("delete_user")
+authenticate_user = _dispatch("authenticate_user")
+create_advertisement = _dispatch("create_advertisement")
+get_advertisement = _dispatch("get_advertisement")
+get_advertisements_by_ids = _dispatch("get_advertisements_by_ids")
+update_advertisement = _dispatch("update_advertisement")
+delete_advertisement = _dispatch("delete_advertisement")
+bulk_create_advertisements = _dispatch("bulk_create_advertisements")
+bulk_update_advertisements = _dispatch("bulk_update_advertisements")
+bulk_delete_advertisements = _dispatch("bulk_delete_advertisements")
+search_advertisements = _dispatch("search_advertisements")
+search_advertisement_rows = _dispatch("search_advertisement_rows")
+advertisement_facets = _dispatch("advertisement_facets")
+get_advertisements = _dispatch("get_advertisements")
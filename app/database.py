@@ -1,18 +1,88 @@
+from typing import Optional, Union
 from sqlalchemy import create_engine
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Session
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
+from app import querystats
+from app.metrics import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+
+# psycopg2: executemany для UPDATE/DELETE пачками (execute_batch), а не по строке
+engine_options = {}
+if make_url(settings.DATABASE_URL).get_driver_name() == "psycopg2":
+    engine_options["executemany_mode"] = "values_plus_batch"
+
+
+def pool_options() -> dict:
+    # Соединения всех воркеров не должны превышать max_connections сервера
+    workers = max(1, settings.WEB_CONCURRENCY)
+    per_worker = max(1, min(30, (settings.DB_MAX_CONNECTIONS - settings.DB_RESERVED_CONNECTIONS) // workers))
+    pool_size = settings.DB_POOL_SIZE if settings.DB_POOL_SIZE is not None else max(1, per_worker // 3)
+    max_overflow = settings.DB_MAX_OVERFLOW if settings.DB_MAX_OVERFLOW is not None else per_worker - pool_size
+    return {"pool_size": pool_size, "max_overflow": max(0, max_overflow), "pool_timeout": settings.DB_POOL_TIMEOUT}
+
 
 engine = create_engine(
     settings.DATABASE_URL,
+    poolclass=InstrumentedQueuePool,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20,
-    echo=False
+    echo=False,
+    **pool_options(),
+    **engine_options
 )
 
+querystats.instrument(engine)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def async_connect_args(url: str) -> dict:
+    # psycopg2 не умеет серверные prepared statements, asyncpg готовит каждый запрос;
+    # кэш подготовленных запросов SQLAlchemy хранит их по тексту SQL на соединение
+    if make_url(url).get_driver_name() != "asyncpg":
+        return {}
+    return {"prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE}
+
+
+def get_async_database_url(url: Optional[str] = None) -> str:
+    if url is None:
+        if settings.ASYNC_DATABASE_URL:
+            return settings.ASYNC_DATABASE_URL
+        url = settings.DATABASE_URL
+    for sync_prefix, async_prefix in (
+            ("postgresql+psycopg2://", "postgresql+asyncpg://"),
+            ("postgresql://", "postgresql+asyncpg://"),
+            ("sqlite://", "sqlite+aiosqlite://"),
+    ):
+        if url.startswith(sync_prefix):
+            return async_prefix + url[len(sync_prefix):]
+    return url
+
+
+async_engine = None
+AsyncSessionLocal = None
+
+if settings.DB_ASYNC:
+    async_url = get_async_database_url()
+    # aiosqlite работает без пула (NullPool)
+    async_pool_options = {} if async_url.startswith("sqlite") else {
+        "poolclass": InstrumentedAsyncQueuePool,
+        **pool_options()
+    }
+    async_engine = create_async_engine(
+        async_url,
+        pool_pre_ping=True,
+        echo=False,
+        connect_args=async_connect_args(async_url),
+        **async_pool_options
+    )
+    querystats.instrument(async_engine.sync_engine)
+    # expire_on_commit=False: после commit атрибуты нельзя догружать лениво
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+DbSession = Union[Session, AsyncSession]
+
 class Base(DeclarativeBase):
     pass
 
@@ -21,4 +91,11 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Зависимость для роутеров: стек выбирается через Settings.DB_ASYNC
+get_session = get_async_db if settings.DB_ASYNC else get_db
@@ -0,0 +1,230 @@
+import asyncio
+import itertools
+import json
+import os
+from collections import deque
+from typing import Deque, List, NamedTuple, Optional, Set
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from app import adindex, notifications, schemas
+from app.cache import advertisement_cache, invalidate_advertisement, search_cache
+from app.config import settings
+
+CHANNEL = "advertisement_events"
+
+CREATED = "created"
+UPDATED = "updated"
+DELETED = "deleted"
+
+# Одно уведомление на объявление, отправляется при commit транзакции записи.
+# id события - номер транзакции и id объявления, одинаковый во всех воркерах
+NOTIFY_SQL = text(
+    "SELECT pg_notify(CAST(:channel AS text), json_build_object("
+    "'id', txid_current() || '-' || (a ->> 'id'), 'type', CAST(:type AS text), 'advertisement', a)::text) "
+    "FROM json_array_elements(CAST(:advertisements AS json)) AS a"
+)
+
+_PENDING = "advertisement_events"
+_local_ids = itertools.count(1)
+
+
+class Event(NamedTuple):
+    id: str
+    type: str
+    advertisement: dict
+
+    def encode(self) -> bytes:
+        data = json.dumps(self.advertisement, ensure_ascii=False)
+        return f"id: {self.id}\nevent: {self.type}\ndata: {data}\n\n".encode("utf-8")
+
+
+class Subscriber:
+    # Очередь ограничена: медленный клиент не копит события в памяти воркера
+    def __init__(self, min_price: Optional[float] = None, max_price: Optional[float] = None,
+                 author: Optional[str] = None):
+        self.min_price = min_price
+        self.max_price = max_price
+        self.author = author
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.closed = False
+
+    def matches(self, event: Event) -> bool:
+        advertisement = event.advertisement
+        if self.min_price is not None and advertisement["price"] < self.min_price:
+            return False
+        if self.max_price is not None and advertisement["price"] > self.max_price:
+            return False
+        if self.author and self.author not in advertisement["author"].lower():
+            return False
+        return True
+
+    def close(self):
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+
+class EventHub:
+    # Подписчики и последние события воркера; все методы - в потоке event loop
+    def __init__(self, history_size: int):
+        self.history: Deque[Event] = deque(maxlen=history_size)
+        self.subscribers: Set[Subscriber] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def dispatch(self, event: Event):
+        self.history.append(event)
+        for subscriber in list(self.subscribers):
+            if not subscriber.matches(event):
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Поток закрывается, клиент переподключается с Last-Event-ID
+                # и дочитывает пропущенное из истории
+                self.unsubscribe(subscriber)
+                subscriber.close()
+
+    def dispatch_threadsafe(self, event: Event):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.dispatch, event)
+
+    def subscribe(self, subscriber: Subscriber, last_event_id: Optional[str] = None) -> Optional[List[Event]]:
+        # События после last_event_id; None - его уже нет в истории
+        self.subscribers.add(subscriber)
+        if last_event_id is None:
+            return []
+        history = list(self.history)
+        for index in range(len(history) - 1, -1, -1):
+            if history[index].id == last_event_id:
+                return [event for event in history[index + 1:] if subscriber.matches(event)]
+        return None
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def reset(self):
+        # События могли потеряться: продолжить с Last-Event-ID уже нельзя
+        self.history.clear()
+        for subscriber in list(self.subscribers):
+            self.unsubscribe(subscriber)
+            subscriber.close()
+
+
+hub = EventHub(settings.EVENTS_HISTORY_SIZE)
+
+
+def advertisement_payloads(rows) -> List[dict]:
+    return [schemas.Advertisement.model_validate(row).model_dump(mode="json") for row in rows]
+
+
+def _notify_params(event_type: str, rows) -> dict:
+    return {
+        "channel": CHANNEL,
+        "type": event_type,
+        "advertisements": json.dumps(advertisement_payloads(rows), ensure_ascii=False),
+    }
+
+
+def _queue_local(db, event_type: str, rows):
+    # Без PostgreSQL события получают только подписчики этого процесса, после commit
+    db.info.setdefault(_PENDING, []).extend(
+        (event_type, advertisement) for advertisement in advertisement_payloads(rows)
+    )
+
+
+def enabled() -> bool:
+    return settings.ADVERTISEMENT_EVENTS
+
+
+def publish(db: Session, event_type: str, rows):
+    # Вызывается до commit: уведомление уходит вместе с транзакцией записи
+    if not rows:
+        return
+    if notifications.use_notify(db):
+        db.execute(NOTIFY_SQL, _notify_params(event_type, rows))
+    elif enabled():
+        _queue_local(db, event_type, rows)
+
+
+async def publish_async(db, event_type: str, rows):
+    if not rows:
+        return
+    if notifications.use_notify(db):
+        await db.execute(NOTIFY_SQL, _notify_params(event_type, rows))
+    elif enabled():
+        _queue_local(db, event_type, rows)
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_pending(session):
+    for event_type, advertisement in session.info.pop(_PENDING, ()):
+        hub.dispatch_threadsafe(Event(f"{os.getpid()}-{next(_local_ids)}", event_type, advertisement))
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session):
+    session.info.pop(_PENDING, None)
+
+
+def _handle_notifications(payloads: List[str]):
+    messages = [json.loads(payload) for payload in payloads]
+    # Запись могла быть сделана другим воркером: сбрасываем локальные кэши
+    # и обновляем индекс одним применением на все уведомления
+    changes = {}
+    for message in messages:
+        advertisement = message["advertisement"]
+        changes[advertisement["id"]] = None if message["type"] == DELETED else adindex.Entry(
+            advertisement["id"], advertisement["price"], advertisement["created_at"]
+        )
+    invalidate_advertisement(*changes)
+    adindex.submit(changes)
+    # Лента SSE отключается настройкой, инвалидация кэшей и индекса - нет
+    if enabled():
+        for message in messages:
+            hub.dispatch(Event(message["id"], message["type"], message["advertisement"]))
+
+
+def _listener_connected(reconnected: bool):
+    if reconnected:
+        # Пока соединения не было, уведомления (и инвалидации кэша) терялись
+        hub.reset()
+        advertisement_cache.clear()
+        search_cache.clear()
+        adindex.request_resync()
+
+
+notifications.register(CHANNEL, _handle_notifications, connected=_listener_connected)
+
+
+async def stream(subscriber: Subscriber, last_event_id: Optional[str] = None):
+    missed = hub.subscribe(subscriber, last_event_id)
+    try:
+        yield f"retry: {int(settings.EVENTS_RECONNECT_SECONDS * 1000)}\n\n".encode("utf-8")
+        if missed is None:
+            # Клиенту нужно перечитать список; следующий Last-Event-ID уже найдется в истории
+            last_id = f"id: {hub.history[-1].id}\n" if hub.history else ""
+            yield f"{last_id}event: reset\ndata: {{}}\n\n".encode("utf-8")
+        for missed_event in missed or ():
+            yield missed_event.encode()
+        while True:
+            try:
+                next_event = await asyncio.wait_for(subscriber.queue.get(), settings.EVENTS_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if subscriber.closed:
+                break
+            yield next_event.encode()
+    finally:
+        hub.unsubscribe(subscriber)
+
+
+def start():
+    hub.loop = asyncio.get_running_loop()
+
+
+def stop():
+    hub.reset()
+    hub.loop = None
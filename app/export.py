@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterable, Sequence
+from app import crud, crud_async
+from app.config import settings
+from app.crud import EXPORT_COLUMNS
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def ndjson_chunk(rows: Iterable[Sequence]) -> bytes:
+    return "".join(
+        json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False, default=_json_default) + "\n"
+        for row in rows
+    ).encode("utf-8")
+
+
+def csv_chunk(rows: Iterable[Sequence], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    writer.writerows(
+        [value.isoformat() if isinstance(value, datetime) else value for value in row]
+        for row in rows
+    )
+    return buffer.getvalue().encode("utf-8")
+
+
+def _format_chunk(export_format: str, rows, first: bool) -> bytes:
+    if export_format == "csv":
+        return csv_chunk(rows, header=first)
+    return ndjson_chunk(rows)
+
+
+# Сессия открывается внутри генератора: зависимость get_session
+# закрывается до того, как StreamingResponse начнет отдавать тело
+def stream_export(export_format: str, params: dict, session_factory):
+    with session_factory() as db:
+        first = True
+        for rows in crud.iter_advertisement_rows(db, settings.EXPORT_CHUNK_SIZE, **params):
+            yield _format_chunk(export_format, rows, first)
+            first = False
+        if first and export_format == "csv":
+            yield csv_chunk([], header=True)
+
+
+async def stream_export_async(export_format: str, params: dict, session_factory):
+    async with session_factory() as db:
+        first = True
+        async for rows in crud_async.iter_advertisement_rows(db, settings.EXPORT_CHUNK_SIZE, **params):
+            yield _format_chunk(export_format, rows, first)
+            first = False
+        if first and export_format == "csv":
+            yield csv_chunk([], header=True)
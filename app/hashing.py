@@ -0,0 +1,114 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional, Tuple
+from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
+from app.config import settings
+from app.metrics import PASSWORD_HASH_DURATION
+
+
+class HashingPoolBusy(Exception):
+    pass
+
+
+def _build_context() -> CryptContext:
+    scheme = settings.PASSWORD_HASH_SCHEME
+    # bcrypt остается в списке, чтобы старые хэши проверялись и перехэшировались
+    schemes = [scheme] if scheme == "bcrypt" else [scheme, "bcrypt"]
+    return CryptContext(
+        schemes=schemes,
+        deprecated="auto",
+        **{f"{scheme}__rounds": settings.PASSWORD_HASH_ROUNDS}
+    )
+
+
+pwd_context = _build_context()
+
+
+# Выполняются в процессах пула
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+# Выполняемые + ожидающие задачи; сверх лимита - отказ (503)
+_slots = threading.BoundedSemaphore(max(1, settings.HASH_POOL_WORKERS + settings.HASH_QUEUE_SIZE))
+
+
+def _pool_enabled() -> bool:
+    return settings.HASH_POOL_WORKERS > 0
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # fork из многопоточного процесса небезопасен;
+                # forkserver с предзагрузкой дешевле spawn
+                mp_context = multiprocessing.get_context("forkserver")
+                mp_context.set_forkserver_preload(["app.hashing"])
+                _executor = ProcessPoolExecutor(
+                    max_workers=settings.HASH_POOL_WORKERS,
+                    mp_context=mp_context
+                )
+    return _executor
+
+
+def _submit(fn, *args) -> Future:
+    if not _slots.acquire(blocking=False):
+        raise HashingPoolBusy()
+    try:
+        future = _get_executor().submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def shutdown_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def get_password_hash(password: str) -> str:
+    with PASSWORD_HASH_DURATION.labels("hash").time():
+        if not _pool_enabled():
+            return _hash(password)
+        return _submit(_hash, password).result()
+
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    with PASSWORD_HASH_DURATION.labels("verify").time():
+        if not _pool_enabled():
+            return _verify_and_update(plain_password, hashed_password)
+        return _submit(_verify_and_update, plain_password, hashed_password).result()
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return verify_and_update_password(plain_password, hashed_password)[0]
+
+
+async def get_password_hash_async(password: str) -> str:
+    with PASSWORD_HASH_DURATION.labels("hash").time():
+        if not _pool_enabled():
+            return await run_in_threadpool(_hash, password)
+        return await asyncio.wrap_future(_submit(_hash, password))
+
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    with PASSWORD_HASH_DURATION.labels("verify").time():
+        if not _pool_enabled():
+            return await run_in_threadpool(_verify_and_update, plain_password, hashed_password)
+        return await asyncio.wrap_future(_submit(_verify_and_update, plain_password, hashed_password))
@@ -1,8 +1,15 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse, Response
 from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 import logging
-from app.database import engine, Base
+import os
+import anyio.to_thread
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from app import adindex, admission, events, hashing, metrics, notifications, ratelimit, replicas
+from app.cache import cache_stats
+from app.querystats import QueryStatsMiddleware
+from app.database import engine, async_engine, Base
 from app.routers import advertisements, auth, users
 from app.config import settings
 
@@ -11,12 +18,33 @@ logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    try:
-        Base.metadata.create_all(bind=engine)
-        logger.info("Database tables created successfully")
-    except Exception as e:
-        logger.error(f"Error creating database tables: {e}")
+    if settings.THREADPOOL_SIZE:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = settings.THREADPOOL_SIZE
+    if settings.DB_CREATE_ALL:
+        try:
+            Base.metadata.create_all(bind=engine)
+            logger.info("Database tables created successfully")
+        except Exception as e:
+            logger.error(f"Error creating database tables: {e}")
+    health_checks = replicas.start_health_checks()
+    events.start()
+    #Одно соединение LISTEN на воркер для событий объявлений и отзыва токенов
+    listener = notifications.start()
+    index_loader = adindex.start()
     yield
+    if health_checks is not None:
+        health_checks.cancel()
+    if listener is not None:
+        listener.cancel()
+    if index_loader is not None:
+        index_loader.cancel()
+    events.stop()
+    await replicas.dispose()
+    await ratelimit.close()
+    hashing.shutdown_pool()
+    if async_engine is not None:
+        await async_engine.dispose()
+    metrics.mark_process_dead(os.getpid())
     logger.info("Application shutting down")
 
 app = FastAPI(
@@ -29,13 +57,36 @@ app = FastAPI(
     openapi_url="/openapi.json"
 )
 
+if settings.ADMISSION_CONTROL:
+    app.add_middleware(admission.AdmissionControlMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing"],
 )
+app.add_middleware(QueryStatsMiddleware)
+if replicas.replicas:
+    app.add_middleware(replicas.ReadYourWritesMiddleware)
+
+@app.exception_handler(hashing.HashingPoolBusy)
+async def hashing_pool_busy_handler(request: Request, exc: hashing.HashingPoolBusy):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, try again later"},
+        headers={"Retry-After": str(settings.HASH_RETRY_AFTER_SECONDS)},
+    )
+
+@app.exception_handler(PoolTimeoutError)
+async def db_pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    #Соединение не освободилось за DB_POOL_TIMEOUT
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server is busy, try again later"},
+        headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_SECONDS)},
+    )
 
 app.include_router(auth.router, prefix=settings.API_V1_PREFIX)
 app.include_router(users.router, prefix=settings.API_V1_PREFIX)
@@ -54,5 +105,12 @@ def health_check():
     return {
         "status": "healthy",
         "service": settings.PROJECT_NAME,
-        "version": settings.VERSION
-    }
\ No newline at end of file
+        "version": settings.VERSION,
+        "caches": cache_stats(),
+        "advertisement_index": adindex.advertisement_index.stats(),
+        "admission": admission.stats()
+    }
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(metrics.render_metrics(), media_type=metrics.CONTENT_TYPE_LATEST)
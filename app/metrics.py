@@ -0,0 +1,162 @@
+import logging
+import os
+import time
+from fastapi.routing import APIRoute
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from app.config import settings
+
+# Несколько воркеров (uvicorn --workers, gunicorn): каждый процесс пишет метрики
+# в файлы PROMETHEUS_MULTIPROC_DIR, /metrics суммирует их по всем процессам.
+# Каталог должен быть пустым при старте сервера
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+if MULTIPROCESS:
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency",
+    ["method", "route"],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "HTTP requests being processed",
+    ["method", "route"],
+    multiprocess_mode="livesum"
+)
+RESPONSES = Counter(
+    "http_responses",
+    "HTTP responses by status code",
+    ["method", "route", "status"]
+)
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool",
+    ["engine"],
+    buckets=(.0005, .001, .005, .01, .025, .05, .1, .25, .5, 1, 5, 30)
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Connections checked out from the SQLAlchemy pool",
+    ["engine"],
+    multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow",
+    "Connections opened above pool_size",
+    ["engine"],
+    multiprocess_mode="livesum"
+)
+
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds",
+    "Password hash/verify latency, including the hashing pool queue",
+    ["operation"],
+    buckets=(.01, .05, .1, .2, .3, .5, 1, 2, 5)
+)
+
+ADMISSION_REJECTED = Counter(
+    "admission_rejected",
+    "Requests rejected with 503 by admission control",
+    ["route_class", "reason"]
+)
+ADMISSION_WAIT = Histogram(
+    "admission_wait_seconds",
+    "Time spent in the admission control queue",
+    ["route_class"],
+    buckets=(.001, .005, .01, .05, .1, .25, .5, 1, 2, 5)
+)
+
+# SSE-поток открыт часами: не попадает в гистограмму задержек и в число
+# выполняемых запросов, считается только ответ
+STREAMING_ROUTES = {("GET", "/advertisement/events")}
+
+LOGIN_RATE_LIMITED = Counter(
+    "login_rate_limited",
+    "Login attempts rejected by the rate limiter before authentication",
+    ["bucket"]
+)
+
+
+class InstrumentedRoute(APIRoute):
+    # Метрики по шаблону пути (/advertisement/{advertisement_id}), а не по URL
+    async def handle(self, scope, receive, send):
+        method = scope["method"]
+        path = self.path
+        if settings.API_V1_PREFIX and path.startswith(settings.API_V1_PREFIX):
+            path = path[len(settings.API_V1_PREFIX):]
+        streaming = (method, path) in STREAMING_ROUTES
+        # Исключения с обработчиком приложения (HashingPoolBusy, PoolTimeoutError -> 503)
+        # превращаются в ответ внутри маршрута, код берется из этого ответа.
+        # Дошедшее сюда исключение без начатого ответа ServerErrorMiddleware отдаст как 500
+        status_code = None
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress = None if streaming else REQUESTS_IN_PROGRESS.labels(method, self.path)
+        if in_progress:
+            in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await super().handle(scope, receive, send_with_status)
+        finally:
+            if in_progress:
+                in_progress.dec()
+                REQUEST_DURATION.labels(method, self.path).observe(time.perf_counter() - start)
+            RESPONSES.labels(method, self.path, str(status_code or 500)).inc()
+
+
+class _PoolMetrics:
+    metrics_engine = ""
+
+    def _update_pool_metrics(self):
+        DB_POOL_CHECKED_OUT.labels(self.metrics_engine).set(self.checkedout())
+        # overflow() отрицателен, пока пул не заполнен до pool_size
+        DB_POOL_OVERFLOW.labels(self.metrics_engine).set(max(0, self.overflow()))
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.labels(self.metrics_engine).observe(time.perf_counter() - start)
+            self._update_pool_metrics()
+
+    def _do_return_conn(self, record):
+        super()._do_return_conn(record)
+        self._update_pool_metrics()
+
+
+class InstrumentedQueuePool(_PoolMetrics, QueuePool):
+    metrics_engine = "sync"
+
+
+class InstrumentedAsyncQueuePool(_PoolMetrics, AsyncAdaptedQueuePool):
+    metrics_engine = "async"
+
+
+# Логгер пула называется по модулю класса и выходит из-под логгера "sqlalchemy"
+# (уровень WARN): без этого dispose/reconnect пишут INFO в лог приложения
+for _pool_class in (InstrumentedQueuePool, InstrumentedAsyncQueuePool):
+    logging.getLogger(f"{_pool_class.__module__}.{_pool_class.__name__}").setLevel(logging.WARN)
+
+
+def render_metrics() -> bytes:
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead(pid: int):
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, func, Boolean, Enum
+from sqlalchemy import Column, Integer, String, Float, DateTime, func, Boolean, Enum, DDL, Index, event, text
 import enum
+from app.config import settings
 from app.database import Base
 
 
@@ -17,6 +18,8 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     is_active = Column(Boolean, default=True)
     role = Column(Enum(UserRole), default=UserRole.USER, nullable=False)
+    # Увеличивается при смене пароля, роли или активности: токены со старой версией недействительны
+    token_version = Column(Integer, nullable=False, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     def __repr__(self):
@@ -31,8 +34,61 @@ class Advertisement(Base):
     description = Column(String(1000), nullable=True)
     price = Column(Float, nullable=False)
     author = Column(String(100), nullable=False, index=True)
-    owner_id = Column(Integer, nullable=True)  # ID пользователя-владельца
+    owner_id = Column(Integer, nullable=True, index=True)  # ID пользователя-владельца
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Схема в БД создается миграциями (migrations/versions), индексы здесь
+    # должны совпадать с ними
+    __table_args__ = (
+        Index("ix_advertisements_created_at_id", "created_at", "id"),
+        Index("ix_advertisements_price_id", "price", "id"),
+    )
+
     def __repr__(self):
-        return f"<Advertisement(id={self.id}, title='{self.title}', price={self.price})>"
\ No newline at end of file
+        return f"<Advertisement(id={self.id}, title='{self.title}', price={self.price})>"
+
+
+Index("ix_advertisements_author_lower", func.lower(Advertisement.author))
+
+# Полнотекстовый поиск (только PostgreSQL): generated tsvector + GIN,
+# trigram-индексы для ilike по title/author/description.
+# Для Base.metadata.create_all (DB_CREATE_ALL); миграция - migrations/versions/0002_search.py
+def _has_pg_trgm(ddl, target, bind, **kw):
+    return bind.execute(
+        text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).first() is not None
+
+
+event.listen(
+    Advertisement.__table__,
+    "after_create",
+    DDL(
+        "ALTER TABLE advertisements ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('{cfg}', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('{cfg}', coalesce(author, '')), 'B') || "
+        "setweight(to_tsvector('{cfg}', coalesce(description, '')), 'C')"
+        ") STORED".format(cfg=settings.SEARCH_TS_CONFIG)
+    ).execute_if(dialect="postgresql")
+)
+event.listen(
+    Advertisement.__table__,
+    "after_create",
+    DDL(
+        "CREATE INDEX ix_advertisements_search_vector "
+        "ON advertisements USING gin (search_vector)"
+    ).execute_if(dialect="postgresql")
+)
+
+for _statement in (
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE INDEX ix_advertisements_title_trgm ON advertisements USING gin (title gin_trgm_ops)",
+        "CREATE INDEX ix_advertisements_author_trgm ON advertisements USING gin (author gin_trgm_ops)",
+        "CREATE INDEX ix_advertisements_description_trgm "
+        "ON advertisements USING gin (description gin_trgm_ops)",
+):
+    event.listen(
+        Advertisement.__table__,
+        "after_create",
+        DDL(_statement).execute_if(dialect="postgresql", callable_=_has_pg_trgm)
+    )
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List, NamedTuple, Optional
+from sqlalchemy import text
+from app.config import settings
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+# Уведомление уходит при commit транзакции, в которой выполнено
+NOTIFY_SQL = text("SELECT pg_notify(CAST(:channel AS text), CAST(:payload AS text))")
+
+
+class Channel(NamedTuple):
+    # Все уведомления канала за одно чтение соединения, по порядку commit
+    handle: Callable[[List[str]], None]
+    # Вызывается после LISTEN; аргумент - было ли соединение потеряно до этого
+    connected: Optional[Callable[[bool], None]] = None
+    disconnected: Optional[Callable[[], None]] = None
+
+
+_channels: Dict[str, Channel] = {}
+
+
+def register(name: str, handle: Callable[[List[str]], None],
+             connected: Optional[Callable[[bool], None]] = None,
+             disconnected: Optional[Callable[[], None]] = None):
+    _channels[name] = Channel(handle, connected, disconnected)
+
+
+def use_notify(db) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+
+class Listener:
+    # Отдельное соединение psycopg2 (вне пула) на воркер: LISTEN всех каналов,
+    # уведомления читаются в event loop без отдельного потока
+    def __init__(self, engine):
+        self.engine = engine
+        self.connection = None
+        self.lost: Optional[asyncio.Event] = None
+
+    def _connect(self):
+        cargs, cparams = self.engine.dialect.create_connect_args(self.engine.url)
+        # keepalive: оборванное TCP-соединение обнаружится, а не будет молча ждать
+        connection = self.engine.dialect.loaded_dbapi.connect(
+            *cargs, keepalives=1, keepalives_idle=30, keepalives_interval=10, keepalives_count=3, **cparams
+        )
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            for name in _channels:
+                cursor.execute(f"LISTEN {name}")
+        return connection
+
+    def _on_readable(self):
+        try:
+            self.connection.poll()
+        except Exception as e:
+            logger.warning("Notifications connection lost: %s", e)
+            self.lost.set()
+            return
+        # Пакет записи (тысячи строк) приходит тысячами уведомлений: обработчик
+        # канала вызывается один раз на все прочитанные
+        batches: Dict[str, List[str]] = {}
+        for notify in self.connection.notifies:
+            batches.setdefault(notify.channel, []).append(notify.payload)
+        self.connection.notifies.clear()
+        for name, payloads in batches.items():
+            try:
+                _channels[name].handle(payloads)
+            except Exception:
+                logger.exception("Cannot handle notifications on %s", name)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        reconnected = False
+        while True:
+            try:
+                self.connection = await loop.run_in_executor(None, self._connect)
+            except Exception as e:
+                logger.warning("Notifications: cannot LISTEN: %s", e)
+                await asyncio.sleep(settings.EVENTS_RECONNECT_SECONDS)
+                continue
+            for channel in _channels.values():
+                if channel.connected is not None:
+                    channel.connected(reconnected)
+            reconnected = True
+
+            self.lost = asyncio.Event()
+            fileno = self.connection.fileno()
+            loop.add_reader(fileno, self._on_readable)
+            try:
+                await self.lost.wait()
+            finally:
+                loop.remove_reader(fileno)
+                self.connection.close()
+                self.connection = None
+                # Пока соединения нет, уведомления других воркеров теряются
+                for channel in _channels.values():
+                    if channel.disconnected is not None:
+                        channel.disconnected()
+            await asyncio.sleep(settings.EVENTS_RECONNECT_SECONDS)
+
+
+def start() -> Optional[asyncio.Task]:
+    if engine.dialect.name != "postgresql" or engine.dialect.driver != "psycopg2":
+        if settings.SINGLE_PROCESS and settings.WEB_CONCURRENCY <= 1:
+            # Один процесс: все уведомления локальные и уже доставлены
+            for channel in _channels.values():
+                if channel.connected is not None:
+                    channel.connected(False)
+            return None
+        # Число процессов неизвестно: уведомления других воркеров могут не прийти,
+        # каналы остаются неподключенными (отзывы токенов не считаются полными)
+        logger.warning(
+            "LISTEN/NOTIFY between workers requires PostgreSQL with psycopg2, got %s+%s; "
+            "set SINGLE_PROCESS=true if the app runs as one process",
+            engine.dialect.name, engine.dialect.driver
+        )
+        return None
+    if not _channels:
+        return None
+    return asyncio.create_task(Listener(engine).run())
@@ -0,0 +1,63 @@
+import base64
+import binascii
+import json
+import math
+from datetime import datetime
+from typing import Any, Tuple
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value: Any):
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+# Тип значения курсора для каждой сортировки (relevance курсор не поддерживает)
+_NUMBER_FIELDS = {"price"}
+_DATETIME_FIELDS = {"created_at"}
+_TEXT_FIELDS = {"title", "author"}
+_MAX_ID = 2 ** 63 - 1
+
+
+def _decode_value(value: Any, sort_by: str):
+    if sort_by in _NUMBER_FIELDS:
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+            return value
+    elif sort_by in _DATETIME_FIELDS:
+        if isinstance(value, dict) and isinstance(value.get("dt"), str):
+            return datetime.fromisoformat(value["dt"])
+    elif sort_by in _TEXT_FIELDS:
+        if isinstance(value, str):
+            return value
+    raise InvalidCursor("Cursor value does not match sort_by")
+
+
+def encode_cursor(sort_by: str, sort_order: str, value: Any, last_id: int) -> str:
+    payload = {"s": sort_by, "o": sort_order, "v": _encode_value(value), "id": last_id}
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_by: str, sort_order: str) -> Tuple[Any, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        if not isinstance(payload, dict):
+            raise InvalidCursor("Malformed cursor")
+        # Курсор привязан к сортировке, с которой он был выдан
+        if payload.get("s") != sort_by or payload.get("o") != sort_order:
+            raise InvalidCursor("Cursor does not match sort_by/sort_order")
+        value = _decode_value(payload["v"], sort_by)
+        last_id = payload["id"]
+    except InvalidCursor:
+        raise
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursor("Malformed cursor")
+
+    if not isinstance(last_id, int) or isinstance(last_id, bool) or not 0 <= last_id <= _MAX_ID:
+        raise InvalidCursor("Malformed cursor")
+    return value, last_id
@@ -0,0 +1,103 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RequestQueries:
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.count = 0
+        self.db_time = 0.0
+        self.statements: Optional[Counter] = Counter() if settings.SQL_DEBUG_REPEATS else None
+
+    @property
+    def route(self) -> str:
+        # scope["route"] появляется после маршрутизации
+        route = self.scope.get("route")
+        return getattr(route, "path", self.scope.get("path", "-"))
+
+
+# Статистика запросов текущего HTTP-запроса; копия контекста попадает
+# и в threadpool (run_in_threadpool), и в greenlet async-движка
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("request_queries", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Время старта живет в контексте выполнения: упавший запрос (after_cursor_execute
+    # не вызывается) не оставляет следов на соединении
+    if context is not None:
+        context.query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "query_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    stats = _current.get()
+    if stats is not None:
+        stats.count += 1
+        stats.db_time += elapsed
+        if stats.statements is not None:
+            stats.statements[(statement, repr(parameters))] += 1
+
+    if settings.SLOW_QUERY_MS and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+        logger.warning(
+            "Slow query %.1fms [%s]: %s",
+            elapsed * 1000,
+            stats.route if stats is not None else "-",
+            " ".join(statement.split())
+        )
+
+
+def instrument(engine: Engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _report_repeats(stats: RequestQueries):
+    for (statement, parameters), count in stats.statements.items():
+        if count > 1:
+            logger.warning(
+                "Statement repeated %d times [%s]: %s %s",
+                count,
+                stats.route,
+                " ".join(statement.split()),
+                parameters
+            )
+
+
+class QueryStatsMiddleware:
+    # Чистый ASGI-middleware: Server-Timing: db;dur=..;desc="N queries", app;dur=..
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestQueries(scope)
+        token = _current.set(stats)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start" and settings.SERVER_TIMING:
+                total_ms = (time.perf_counter() - start) * 1000
+                db_ms = stats.db_time * 1000
+                value = f'db;dur={db_ms:.1f};desc="{stats.count} queries", app;dur={total_ms - db_ms:.1f}'
+                message["headers"] = [*message.get("headers", []), (b"server-timing", value.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            if stats.statements is not None:
+                _report_repeats(stats)
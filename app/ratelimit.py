@@ -0,0 +1,131 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Tuple
+from fastapi import HTTPException, Request, status
+from app.config import settings
+from app.metrics import LOGIN_RATE_LIMITED
+
+try:
+    import redis.asyncio as redis_asyncio
+    from redis.exceptions import RedisError
+except ImportError:
+    redis_asyncio = None
+
+    class RedisError(Exception):
+        pass
+
+logger = logging.getLogger(__name__)
+
+# Атомарный token bucket в Redis; время берется из Redis, а не с хоста воркера
+REDIS_TOKEN_BUCKET = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(data[1]) or capacity
+local updated = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * rate)
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return tostring(retry_after)
+"""
+
+
+class TokenBucket:
+    # Ключ -> (токены, время обновления); самые давние ключи вытесняются сверх max_keys
+    def __init__(self, name: str, capacity: int, per_minute: float, max_keys: int):
+        self.name = name
+        self.capacity = capacity
+        self.rate = per_minute / 60
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._script = None
+
+    def _take_local(self, key: str) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                retry_after = 0.0
+            else:
+                retry_after = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+    async def take(self, key: str) -> float:
+        # 0 - попытка разрешена, иначе - через сколько секунд появится токен
+        if _redis is not None:
+            if self._script is None:
+                self._script = _redis.register_script(REDIS_TOKEN_BUCKET)
+            try:
+                return float(await self._script(keys=[f"ratelimit:{self.name}:{key}"], args=[self.capacity, self.rate]))
+            except RedisError as e:
+                # Redis недоступен - ограничиваем хотя бы в пределах воркера
+                logger.warning("Rate limit backend error, using in-process limits: %s", e)
+        return self._take_local(key)
+
+
+_redis = None
+if settings.RATE_LIMIT_REDIS_URL:
+    if redis_asyncio is None:
+        raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the redis package is not installed")
+    # Короткие таймауты: при недоступном Redis вход не должен ждать соединения
+    _redis = redis_asyncio.from_url(
+        settings.RATE_LIMIT_REDIS_URL,
+        socket_timeout=0.25,
+        socket_connect_timeout=0.25
+    )
+
+login_ip_bucket = TokenBucket(
+    "login_ip",
+    capacity=settings.LOGIN_IP_BURST,
+    per_minute=settings.LOGIN_IP_PER_MINUTE,
+    max_keys=settings.RATE_LIMIT_MAX_KEYS
+)
+login_username_bucket = TokenBucket(
+    "login_username",
+    capacity=settings.LOGIN_USERNAME_BURST,
+    per_minute=settings.LOGIN_USERNAME_PER_MINUTE,
+    max_keys=settings.RATE_LIMIT_MAX_KEYS
+)
+
+
+async def check_login(request: Request, username: str):
+    # Вызывается до обращения к БД и bcrypt. IP клиента за прокси -
+    # через uvicorn --proxy-headers --forwarded-allow-ips
+    if not settings.LOGIN_RATE_LIMIT_ENABLED:
+        return
+
+    client_ip = request.client.host if request.client else "unknown"
+    for bucket, key in (
+            (login_ip_bucket, client_ip),
+            (login_username_bucket, username.strip().lower()),
+    ):
+        retry_after = await bucket.take(key)
+        if retry_after > 0:
+            LOGIN_RATE_LIMITED.labels(bucket.name).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, try again later",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+
+async def close():
+    if _redis is not None:
+        await _redis.aclose()
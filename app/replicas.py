@@ -0,0 +1,187 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
+from typing import List, Optional
+from fastapi import Request
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+from app import querystats
+from app.cache import TTLCache
+from app.config import settings
+from app.database import AsyncSessionLocal, SessionLocal, async_connect_args, get_async_database_url, pool_options
+from app.metrics import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+
+logger = logging.getLogger(__name__)
+
+# Клиент, выполнивший запись, читает с primary, пока не истечет эта cookie
+STICKY_COOKIE = "primary_until"
+
+# Отставание реплики; если все WAL уже применены - 0, а не время последней транзакции
+LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+
+
+class Replica:
+    def __init__(self, url: str):
+        parsed = make_url(url)
+        self.name = f"{parsed.host or parsed.query.get('host', '')}:{parsed.port or ''}/{parsed.database}"
+        self.healthy = True
+        if settings.DB_ASYNC:
+            async_url = get_async_database_url(url)
+            self.engine = create_async_engine(
+                async_url,
+                poolclass=InstrumentedAsyncQueuePool,
+                pool_pre_ping=True,
+                connect_args=async_connect_args(async_url),
+                **pool_options()
+            )
+            querystats.instrument(self.engine.sync_engine)
+            self.sessionmaker = async_sessionmaker(self.engine, autoflush=False, expire_on_commit=False)
+        else:
+            self.engine = create_engine(
+                url,
+                poolclass=InstrumentedQueuePool,
+                pool_pre_ping=True,
+                **pool_options()
+            )
+            querystats.instrument(self.engine)
+            self.sessionmaker = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+    def _lag_sql(self, dialect_name: str):
+        return LAG_SQL if dialect_name == "postgresql" else text("SELECT 0")
+
+    def _check_sync(self) -> float:
+        with self.engine.connect() as connection:
+            return connection.execute(self._lag_sql(self.engine.dialect.name)).scalar() or 0
+
+    async def check(self):
+        try:
+            if settings.DB_ASYNC:
+                async with self.engine.connect() as connection:
+                    lag = (await connection.execute(self._lag_sql(self.engine.dialect.name))).scalar() or 0
+            else:
+                lag = await run_in_threadpool(self._check_sync)
+            healthy = lag <= settings.REPLICA_MAX_LAG_SECONDS
+            reason = f"lag {lag:.1f}s"
+        except Exception as e:
+            healthy = False
+            reason = str(e).splitlines()[0] if str(e) else type(e).__name__
+
+        if healthy != self.healthy:
+            if healthy:
+                logger.info("Replica %s is back (%s)", self.name, reason)
+            else:
+                logger.warning("Replica %s is unavailable: %s", self.name, reason)
+        self.healthy = healthy
+
+
+replicas: List[Replica] = [
+    Replica(url.strip()) for url in settings.DATABASE_REPLICA_URLS.split(",") if url.strip()
+]
+_round_robin = itertools.count()
+
+
+def pick_replica() -> Optional[Replica]:
+    healthy = [replica for replica in replicas if replica.healthy]
+    if not healthy:
+        return None
+    return healthy[next(_round_robin) % len(healthy)]
+
+
+def _sticky(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_replica(request: Request) -> Optional[Replica]:
+    # None - читать с primary (реплик нет, все недоступны или клиент недавно писал)
+    if not replicas or _sticky(request):
+        return None
+    return pick_replica()
+
+
+def read_sessionmaker(request: Request):
+    replica = read_replica(request)
+    if replica is not None:
+        return replica.sessionmaker
+    return AsyncSessionLocal if settings.DB_ASYNC else SessionLocal
+
+
+def get_read_db(request: Request):
+    replica = read_replica(request)
+    db = replica.sessionmaker() if replica is not None else SessionLocal()
+    db.info["replica"] = replica is not None
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_read_async_db(request: Request):
+    replica = read_replica(request)
+    async with (replica.sessionmaker if replica is not None else AsyncSessionLocal)() as db:
+        db.info["replica"] = replica is not None
+        yield db
+
+
+# Зависимость для читающих роутеров: реплика, если настроена и здорова, иначе primary
+get_read_session = get_read_async_db if settings.DB_ASYNC else get_read_db
+
+
+def cacheable(db, cache: TTLCache) -> bool:
+    # Реплика может еще не видеть запись, после которой кэш был сброшен:
+    # такой ответ не кэшируем, пока не пройдет допустимое отставание
+    if not db.info.get("replica"):
+        return True
+    return time.monotonic() - cache.invalidated_at > settings.REPLICA_MAX_LAG_SECONDS
+
+
+async def _health_check_loop():
+    while True:
+        await asyncio.gather(*(replica.check() for replica in replicas))
+        await asyncio.sleep(settings.REPLICA_HEALTH_CHECK_INTERVAL)
+
+
+def start_health_checks() -> Optional[asyncio.Task]:
+    if not replicas:
+        return None
+    return asyncio.create_task(_health_check_loop())
+
+
+async def dispose():
+    for replica in replicas:
+        if settings.DB_ASYNC:
+            await replica.engine.dispose()
+        else:
+            replica.engine.dispose()
+
+
+class ReadYourWritesMiddleware:
+    # После успешной записи клиент получает cookie и READ_YOUR_WRITES_SECONDS читает с primary
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS"):
+            return await self.app(scope, receive, send)
+
+        async def send_with_cookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                window = settings.READ_YOUR_WRITES_SECONDS
+                cookie = (
+                    f"{STICKY_COOKIE}={time.time() + window:.3f}; Max-Age={math.ceil(window)}; "
+                    "Path=/; HttpOnly; SameSite=Lax"
+                )
+                message["headers"] = [*message.get("headers", []), (b"set-cookie", cookie.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from app import notifications
+from app.cache import principal_cache
+from app.config import settings
+
+CHANNEL = "token_revocations"
+
+# Версия для удаленного пользователя: недействительны все его токены
+DELETED_VERSION = 2 ** 31 - 1
+
+
+def access_token_lifetime() -> float:
+    return settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+
+class RevocationList:
+    # user_id -> (минимальная действительная версия токена, до какого момента хранить).
+    # Запись нужна, только пока не истекли access-токены, выданные до отзыва,
+    # поэтому список содержит лишь отзывы за последние ACCESS_TOKEN_EXPIRE_MINUTES
+    def __init__(self):
+        self._entries: Dict[int, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        # С какого момента воркер получает все отзывы (time.monotonic)
+        self.complete_since: Optional[float] = None
+
+    def revoke(self, user_id: int, min_version: int):
+        now = time.monotonic()
+        with self._lock:
+            self._entries = {
+                key: entry for key, entry in self._entries.items() if entry[1] > now
+            }
+            current, _ = self._entries.get(user_id, (0, 0.0))
+            self._entries[user_id] = (max(current, min_version), now + access_token_lifetime())
+
+    def is_revoked(self, user_id: int, version: int) -> bool:
+        entry = self._entries.get(user_id)
+        return entry is not None and entry[1] > time.monotonic() and version < entry[0]
+
+    def complete(self) -> bool:
+        # Токен без отзыва можно принять без БД, только если воркер слушал отзывы
+        # все время жизни токена (после старта или обрыва соединения - нет)
+        return (
+            self.complete_since is not None
+            and time.monotonic() - self.complete_since >= access_token_lifetime()
+        )
+
+    def size(self) -> int:
+        return len(self._entries)
+
+
+revocations = RevocationList()
+
+
+def notify_params(user_id: int, min_version: int) -> dict:
+    return {"channel": CHANNEL, "payload": json.dumps({"user_id": user_id, "version": min_version})}
+
+
+def publish(db, user_id: int, min_version: int):
+    # Вызывается до commit; в своем воркере отзыв применяется сразу после commit (apply)
+    if notifications.use_notify(db):
+        db.execute(notifications.NOTIFY_SQL, notify_params(user_id, min_version))
+
+
+async def publish_async(db, user_id: int, min_version: int):
+    if notifications.use_notify(db):
+        await db.execute(notifications.NOTIFY_SQL, notify_params(user_id, min_version))
+
+
+def apply(user_id: int, min_version: int):
+    revocations.revoke(user_id, min_version)
+
+
+def _handle_notifications(payloads: List[str]):
+    for payload in payloads:
+        message = json.loads(payload)
+        revocations.revoke(message["user_id"], message["version"])
+        # Пользователь изменен другим воркером: токены без версии проверяются по БД
+        principal_cache.invalidate(message["user_id"])
+
+
+def _listener_connected(reconnected: bool):
+    if reconnected:
+        # Пока соединения не было, отзывы других воркеров терялись
+        principal_cache.clear()
+    revocations.complete_since = time.monotonic()
+
+
+def _listener_disconnected():
+    revocations.complete_since = None
+
+
+notifications.register(
+    CHANNEL,
+    _handle_notifications,
+    connected=_listener_connected,
+    disconnected=_listener_disconnected
+)
@@ -1,18 +1,89 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
-from typing import Optional, List
-from app import crud, schemas, auth
-from app.database import get_db
+import hashlib
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Literal, Optional, List
+from app import dal, events, export, replicas, schemas, serialization, auth
+from app.cache import CachedPage, CachedResponse, advertisement_cache, search_cache
+from app.pagination import InvalidCursor, decode_cursor, encode_cursor
+from app.config import settings
+from app.database import DbSession, get_session
+from app.metrics import InstrumentedRoute
 from app.auth import get_current_user, check_user_permission
 
-router = APIRouter(prefix="/advertisement", tags=["advertisements"])
+router = APIRouter(prefix="/advertisement", tags=["advertisements"], route_class=InstrumentedRoute)
+
+
+def _render_advertisement(db_advertisement) -> CachedResponse:
+    # Те же байты, что дал бы response_model=schemas.Advertisement
+    data = schemas.Advertisement.model_validate(db_advertisement).model_dump(mode="json")
+    body = JSONResponse(content=data).body
+    return CachedResponse(body=body, etag=f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+
+
+def _normalize_text(value: Optional[str]) -> Optional[str]:
+    # Фильтры регистронезависимы, пустая строка - нет фильтра
+    return value.lower() if value else None
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (tag.strip() for tag in if_none_match.split(","))
+
+
+def advertisement_filters(
+        title: Optional[str] = Query(None, description="Search in title"),
+        author: Optional[str] = Query(None, description="Search by author"),
+        description: Optional[str] = Query(None, description="Search in description"),
+        min_price: Optional[float] = Query(None, ge=0, description="Minimum price"),
+        max_price: Optional[float] = Query(None, ge=0, description="Maximum price"),
+        search_text: Optional[str] = Query(None, description="Search in title, description or author")
+) -> dict:
+    # Общие фильтры поиска, экспорта и агрегатов
+    return {
+        "title": _normalize_text(title),
+        "author": _normalize_text(author),
+        "description": _normalize_text(description),
+        "min_price": min_price,
+        "max_price": max_price,
+        "search_text": _normalize_text(search_text),
+    }
+
+
+def advertisement_sort(
+        sort_by: str = Query("created_at", description="Sort field (title, price, created_at, author, relevance)"),
+        sort_order: str = Query("desc", description="Sort order (asc or desc)"),
+        search_text: Optional[str] = Query(None, include_in_schema=False)
+) -> dict:
+    valid_sort_fields = ["title", "price", "created_at", "author", "relevance"]
+    if sort_by not in valid_sort_fields:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid sort field. Must be one of: {valid_sort_fields}"
+        )
+
+    if sort_by == "relevance" and not search_text:
+        raise HTTPException(
+            status_code=400,
+            detail="Sorting by relevance requires search_text"
+        )
+
+    if sort_order not in ["asc", "desc"]:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid sort order. Must be 'asc' or 'desc'"
+        )
+
+    return {"sort_by": sort_by, "sort_order": sort_order}
 
 
 @router.post("/", response_model=schemas.Advertisement, status_code=status.HTTP_201_CREATED)
-def create_advertisement(
+async def create_advertisement(
         advertisement: schemas.AdvertisementCreate,
-        current_user: Optional[schemas.UserInDB] = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user: Optional[schemas.Principal] = Depends(get_current_user),
+        db: DbSession = Depends(get_session)
 ):
     if not current_user:
         raise HTTPException(
@@ -27,113 +98,299 @@ def create_advertisement(
             detail="Insufficient permissions to create advertisements"
         )
 
-    return crud.create_advertisement(
+    return await dal.create_advertisement(
         db=db,
         advertisement=advertisement,
         owner_id=current_user.id
     )
 
 
+def _check_bulk_size(count: int):
+    if count > settings.BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many items. Maximum is {settings.BULK_MAX_ITEMS}"
+        )
+
+
+@router.post("/bulk", response_model=schemas.BulkResult, status_code=status.HTTP_201_CREATED)
+async def bulk_create_advertisements(
+        bulk: schemas.AdvertisementBulkCreate,
+        current_user: schemas.Principal = Depends(get_current_user),
+        db: DbSession = Depends(get_session)
+):
+    _check_bulk_size(len(bulk.items))
+
+    results = await dal.bulk_create_advertisements(
+        db=db,
+        advertisements=bulk.items,
+        owner_id=current_user.id
+    )
+    return {"results": results}
+
+
+@router.patch("/bulk", response_model=schemas.BulkResult)
+async def bulk_update_advertisements(
+        bulk: schemas.AdvertisementBulkUpdate,
+        current_user: schemas.Principal = Depends(get_current_user),
+        db: DbSession = Depends(get_session)
+):
+    _check_bulk_size(len(bulk.items))
+
+    #Права проверяются для каждого объявления
+    results = await dal.bulk_update_advertisements(
+        db=db,
+        items=bulk.items,
+        owner_id=current_user.id,
+        is_admin=current_user.role == schemas.UserRole.ADMIN
+    )
+    return {"results": results}
+
+
+@router.delete("/bulk", response_model=schemas.BulkResult)
+async def bulk_delete_advertisements(
+        bulk: schemas.AdvertisementBulkDelete,
+        current_user: schemas.Principal = Depends(get_current_user),
+        db: DbSession = Depends(get_session)
+):
+    _check_bulk_size(len(bulk.ids))
+
+    results = await dal.bulk_delete_advertisements(
+        db=db,
+        advertisement_ids=bulk.ids,
+        owner_id=current_user.id,
+        is_admin=current_user.role == schemas.UserRole.ADMIN
+    )
+    return {"results": results}
+
+
+@router.get("/facets", response_model=schemas.AdvertisementFacets)
+async def advertisement_facets(
+        filters: dict = Depends(advertisement_filters),
+        buckets: int = Query(10, ge=1, le=100, description="Number of price histogram buckets"),
+        top_authors: int = Query(10, ge=1, le=100, description="Number of top authors"),
+        approximate: bool = Query(False, description="Use planner estimates and sampling on large tables"),
+        db: DbSession = Depends(replicas.get_read_session)
+):
+    return await dal.advertisement_facets(
+        db,
+        buckets=buckets,
+        top_authors=top_authors,
+        approximate=approximate,
+        **filters
+    )
+
+
+@router.get("/export")
+async def export_advertisements(
+        request: Request,
+        filters: dict = Depends(advertisement_filters),
+        sort: dict = Depends(advertisement_sort),
+        format: Literal["ndjson", "csv"] = Query("ndjson", description="Output format (ndjson or csv)")
+):
+    params = {**filters, **sort}
+    session_factory = replicas.read_sessionmaker(request)
+    if settings.DB_ASYNC:
+        body = export.stream_export_async(format, params, session_factory)
+    else:
+        body = export.stream_export(format, params, session_factory)
+
+    return StreamingResponse(
+        body,
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="advertisements.{format}"'}
+    )
+
+
+@router.get("/events")
+async def advertisement_events(
+        request: Request,
+        min_price: Optional[float] = Query(None, ge=0, description="Minimum price"),
+        max_price: Optional[float] = Query(None, ge=0, description="Maximum price"),
+        author: Optional[str] = Query(None, description="Search by author"),
+        last_event_id: Optional[str] = Query(None, description="Resume after this event (or Last-Event-ID header)")
+):
+    # Server-Sent Events: created / updated / deleted вместо периодического опроса поиска
+    subscriber = events.Subscriber(min_price=min_price, max_price=max_price, author=_normalize_text(author))
+    return StreamingResponse(
+        events.stream(subscriber, request.headers.get("last-event-id") or last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/batch", response_model=schemas.AdvertisementBatch)
+async def read_advertisements_batch(
+        request: Request,
+        ids: List[int] = Query(..., description="Advertisement ids (repeat the parameter)"),
+        db: DbSession = Depends(replicas.get_read_session)
+):
+    # Повторы id отбрасываются, порядок запроса сохраняется
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > settings.BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many ids. Maximum is {settings.BATCH_MAX_IDS}"
+        )
+
+    # Из кэша GET /advertisement/{id}; остальные - одним запросом
+    rendered = {}
+    for advertisement_id in ids:
+        cached = advertisement_cache.get(advertisement_id)
+        if cached is not None:
+            rendered[advertisement_id] = cached
+    misses = [advertisement_id for advertisement_id in ids if advertisement_id not in rendered]
+    if misses:
+        generation = advertisement_cache.generation
+        db_advertisements = await dal.get_advertisements_by_ids(db, advertisement_ids=misses)
+        cacheable = replicas.cacheable(db, advertisement_cache)
+        for db_advertisement in db_advertisements:
+            cached = rendered[db_advertisement.id] = _render_advertisement(db_advertisement)
+            if cacheable:
+                advertisement_cache.set(db_advertisement.id, cached, generation=generation)
+
+    items = b",".join(rendered[advertisement_id].body for advertisement_id in ids if advertisement_id in rendered)
+    missing = JSONResponse(
+        content=[advertisement_id for advertisement_id in ids if advertisement_id not in rendered]
+    ).body
+    body, encoding = serialization.compress(
+        b'{"items":[' + items + b'],"missing":' + missing + b"}", request.headers.get("accept-encoding")
+    )
+    headers = {"Content-Encoding": encoding, "Vary": "Accept-Encoding"} if encoding else {}
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
 @router.get("/{advertisement_id}", response_model=schemas.Advertisement)
-def read_advertisement(
+async def read_advertisement(
         advertisement_id: int,
-        db: Session = Depends(get_db)
+        request: Request,
+        db: DbSession = Depends(replicas.get_read_session)
 ):
-    db_advertisement = crud.get_advertisement(db, advertisement_id=advertisement_id)
-    if db_advertisement is None:
-        raise HTTPException(status_code=404, detail="Advertisement not found")
-    return db_advertisement
+    cached = advertisement_cache.get(advertisement_id)
+    if cached is None:
+        generation = advertisement_cache.generation
+        db_advertisement = await dal.get_advertisement(db, advertisement_id=advertisement_id)
+        if db_advertisement is None:
+            raise HTTPException(status_code=404, detail="Advertisement not found")
+        cached = _render_advertisement(db_advertisement)
+        if replicas.cacheable(db, advertisement_cache):
+            advertisement_cache.set(advertisement_id, cached, generation=generation)
+
+    if _etag_matches(request.headers.get("if-none-match"), cached.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": cached.etag})
+    return Response(content=cached.body, media_type="application/json", headers={"ETag": cached.etag})
 
 
 @router.patch("/{advertisement_id}", response_model=schemas.Advertisement)
-def update_advertisement(
+async def update_advertisement(
         advertisement_id: int,
         advertisement_update: schemas.AdvertisementUpdate,
-        current_user: schemas.UserInDB = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user: schemas.Principal = Depends(get_current_user),
+        db: DbSession = Depends(get_session)
 ):
-    db_advertisement = crud.get_advertisement(db, advertisement_id=advertisement_id)
-    if db_advertisement is None:
-        raise HTTPException(status_code=404, detail="Advertisement not found")
-
-    #Проверка прав
-    if current_user.role != schemas.UserRole.ADMIN:
-        if db_advertisement.owner_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Cannot update other user's advertisement"
-            )
-
-    updated_advertisement = crud.update_advertisement(
+    # Права проверяются в WHERE самого UPDATE
+    result, updated_advertisement = await dal.update_advertisement(
         db=db,
         advertisement_id=advertisement_id,
-        advertisement_update=advertisement_update
+        advertisement_update=advertisement_update,
+        owner_id=current_user.id,
+        is_admin=current_user.role == schemas.UserRole.ADMIN
     )
+    if result == schemas.BulkItemStatus.NOT_FOUND:
+        raise HTTPException(status_code=404, detail="Advertisement not found")
+    if result == schemas.BulkItemStatus.FORBIDDEN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Cannot update other user's advertisement"
+        )
 
     return updated_advertisement
 
 
 @router.delete("/{advertisement_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_advertisement(
+async def delete_advertisement(
         advertisement_id: int,
-        current_user: schemas.UserInDB = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user: schemas.Principal = Depends(get_current_user),
+        db: DbSession = Depends(get_session)
 ):
-    db_advertisement = crud.get_advertisement(db, advertisement_id=advertisement_id)
-    if db_advertisement is None:
-        raise HTTPException(status_code=404, detail="Advertisement not found")
-
-    # Проверка прав:
-    if current_user.role != schemas.UserRole.ADMIN:
-        if db_advertisement.owner_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Cannot delete other user's advertisement"
-            )
-
-    success = crud.delete_advertisement(db=db, advertisement_id=advertisement_id)
-    if not success:
+    result = await dal.delete_advertisement(
+        db=db,
+        advertisement_id=advertisement_id,
+        owner_id=current_user.id,
+        is_admin=current_user.role == schemas.UserRole.ADMIN
+    )
+    if result == schemas.BulkItemStatus.NOT_FOUND:
         raise HTTPException(status_code=404, detail="Advertisement not found")
+    if result == schemas.BulkItemStatus.FORBIDDEN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Cannot delete other user's advertisement"
+        )
     return None
 
 
 @router.get("/", response_model=List[schemas.Advertisement])
-def search_advertisements(
-        title: Optional[str] = Query(None, description="Search in title"),
-        author: Optional[str] = Query(None, description="Search by author"),
-        description: Optional[str] = Query(None, description="Search in description"),
-        min_price: Optional[float] = Query(None, ge=0, description="Minimum price"),
-        max_price: Optional[float] = Query(None, ge=0, description="Maximum price"),
-        search_text: Optional[str] = Query(None, description="Search in title, description or author"),
-        skip: int = Query(0, ge=0),
+async def search_advertisements(
+        request: Request,
+        filters: dict = Depends(advertisement_filters),
+        sort: dict = Depends(advertisement_sort),
+        skip: int = Query(0, ge=0, description="Deprecated, use cursor"),
         limit: int = Query(100, ge=1, le=1000),
-        sort_by: str = Query("created_at", description="Sort field (title, price, created_at, author)"),
-        sort_order: str = Query("desc", description="Sort order (asc or desc)"),
-        db: Session = Depends(get_db)
+        cursor: Optional[str] = Query(None, description="Opaque cursor from the X-Next-Cursor header"),
+        db: DbSession = Depends(replicas.get_read_session)
 ):
-    valid_sort_fields = ["title", "price", "created_at", "author"]
-    if sort_by not in valid_sort_fields:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid sort field. Must be one of: {valid_sort_fields}"
-        )
+    sort_by, sort_order = sort["sort_by"], sort["sort_order"]
 
-    if sort_order not in ["asc", "desc"]:
-        raise HTTPException(
-            status_code=400,
-            detail="Invalid sort order. Must be 'asc' or 'desc'"
-        )
+    after = None
+    if cursor:
+        if sort_by == "relevance":
+            raise HTTPException(
+                status_code=400,
+                detail="Cursor pagination is not supported for relevance sorting"
+            )
+        if skip:
+            raise HTTPException(
+                status_code=400,
+                detail="skip cannot be combined with cursor"
+            )
+        try:
+            after = decode_cursor(cursor, sort_by, sort_order)
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
 
-    return crud.search_advertisements(
-        db=db,
-        title=title,
-        author=author,
-        description=description,
-        min_price=min_price,
-        max_price=max_price,
-        search_text=search_text,
-        skip=skip,
-        limit=limit,
-        sort_by=sort_by,
-        sort_order=sort_order
-    )
\ No newline at end of file
+    cache_key = (
+        *filters.values(), skip if after is None else 0, limit, sort_by, sort_order, after
+    )
+    page = search_cache.get(cache_key)
+    if page is None:
+        generation = search_cache.generation
+        params = dict(filters, skip=skip, limit=limit, sort_by=sort_by, sort_order=sort_order, after=after)
+        if settings.FAST_SERIALIZATION:
+            advertisements = await dal.search_advertisement_rows(
+                db, serialization.ADVERTISEMENT_FIELDS, **params
+            )
+            body = serialization.advertisement_rows_json(advertisements)
+        else:
+            advertisements = await dal.search_advertisements(db, **params)
+            data = [
+                schemas.Advertisement.model_validate(advertisement).model_dump(mode="json")
+                for advertisement in advertisements
+            ]
+            body = JSONResponse(content=data).body
+
+        # Полная страница - возможно, есть следующая
+        next_cursor = None
+        if len(advertisements) == limit and sort_by != "relevance":
+            last = advertisements[-1]
+            next_cursor = encode_cursor(sort_by, sort_order, getattr(last, sort_by), last.id)
+
+        page = CachedPage(body=body, next_cursor=next_cursor)
+        if replicas.cacheable(db, search_cache):
+            search_cache.set(cache_key, page, generation=generation)
+
+    headers = {"X-Next-Cursor": page.next_cursor} if page.next_cursor else {}
+    body, encoding = serialization.compress(page.body, request.headers.get("accept-encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        headers["Vary"] = "Accept-Encoding"
+    return Response(content=body, media_type="application/json", headers=headers)
\ No newline at end of file
@@ -1,21 +1,22 @@
-from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
-from app import crud, schemas
-from app.auth import create_access_token
-from app.config import settings
-from app.database import get_db
+from app import dal, ratelimit, schemas
+from app.auth import REFRESH, decode_token, issue_tokens
+from app.database import DbSession, get_session
+from app.metrics import InstrumentedRoute
 
-router = APIRouter(tags=["authentication"])
+router = APIRouter(tags=["authentication"], route_class=InstrumentedRoute)
 
 
 @router.post("/login", response_model=schemas.Token)
-def login(
+async def login(
         login_data: schemas.LoginRequest,
-        db: Session = Depends(get_db)
+        request: Request,
+        db: DbSession = Depends(get_session)
 ):
-    user = crud.authenticate_user(
+    await ratelimit.check_login(request, login_data.username)
+
+    user = await dal.authenticate_user(
         db,
         username=login_data.username,
         password=login_data.password
@@ -28,29 +29,19 @@ def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    #Временный токен
-    access_token_expires = timedelta(hours=settings.ACCESS_TOKEN_EXPIRE_HOURS)
-    access_token = create_access_token(
-        data={
-            "sub": user.username,
-            "user_id": user.id,
-            "role": user.role.value
-        },
-        expires_delta=access_token_expires
-    )
-
-    return {
-        "access_token": access_token,
-        "token_type": "bearer"
-    }
+    #Короткий access-токен и refresh-токен для его обновления
+    return issue_tokens(user)
 
 
 @router.post("/token", response_model=schemas.Token, include_in_schema=False)
-def login_for_access_token(
+async def login_for_access_token(
+        request: Request,
         form_data: OAuth2PasswordRequestForm = Depends(),
-        db: Session = Depends(get_db)
+        db: DbSession = Depends(get_session)
 ):
-    user = crud.authenticate_user(db, username=form_data.username, password=form_data.password)
+    await ratelimit.check_login(request, form_data.username)
+
+    user = await dal.authenticate_user(db, username=form_data.username, password=form_data.password)
 
     if not user:
         raise HTTPException(
@@ -59,17 +50,23 @@ def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token_expires = timedelta(hours=settings.ACCESS_TOKEN_EXPIRE_HOURS)
-    access_token = create_access_token(
-        data={
-            "sub": user.username,
-            "user_id": user.id,
-            "role": user.role.value
-        },
-        expires_delta=access_token_expires
-    )
+    return issue_tokens(user)
+
+
+@router.post("/refresh", response_model=schemas.Token)
+async def refresh_access_token(
+        refresh: schemas.RefreshRequest,
+        db: DbSession = Depends(get_session)
+):
+    token_data = decode_token(refresh.refresh_token, REFRESH)
+
+    #Пользователь мог быть удален, отключен или сменить пароль
+    user = await dal.get_user_by_id(db, user_id=token_data.user_id)
+    if user is None or not user.is_active or user.token_version != token_data.version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
-    return {
-        "access_token": access_token,
-        "token_type": "bearer"
-    }
\ No newline at end of file
+    return issue_tokens(user)
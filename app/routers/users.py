@@ -1,20 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import Optional
-from app import crud, schemas, auth
-from app.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from typing import List, Optional
+from app import dal, replicas, schemas, auth
+from app.config import settings
+from app.database import DbSession, get_session
+from app.metrics import InstrumentedRoute
 from app.auth import get_current_user, check_user_permission
 
-router = APIRouter(prefix="/user", tags=["users"])
+router = APIRouter(prefix="/user", tags=["users"], route_class=InstrumentedRoute)
 
 
 @router.post("/", response_model=schemas.UserPublic, status_code=status.HTTP_201_CREATED)
-def create_user(
+async def create_user(
         user: schemas.UserCreate,
-        db: Session = Depends(get_db)
+        db: DbSession = Depends(get_session)
 ):
     #Проверка имени
-    db_user = crud.get_user_by_username(db, username=user.username)
+    db_user = await dal.get_user_by_username(db, username=user.username)
     if db_user:
         raise HTTPException(
             status_code=400,
@@ -22,61 +23,93 @@ def create_user(
         )
 
     #Создаем
-    return crud.create_user(db=db, user=user)
+    return await dal.create_user(db=db, user=user)
 
 
 @router.get("/", response_model=schemas.UserPublic)
-def get_current_user_info(
-        current_user: schemas.UserInDB = Depends(get_current_user)
+async def get_current_user_info(
+        current_user: schemas.Principal = Depends(get_current_user),
+        db: DbSession = Depends(get_session)
 ):
-    return current_user
+    #В токене только id и роль: профиль читается из БД
+    db_user = await dal.get_user_by_id(db, user_id=current_user.id)
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return db_user
+
+
+def _visible_user(db_user, current_user: Optional[schemas.Principal]) -> schemas.UserPublic:
+    #Email видят только сам пользователь и администратор
+    response = schemas.UserPublic.model_validate(db_user)
+    if current_user:
+        if current_user.id == response.id or current_user.role == schemas.UserRole.ADMIN:
+            return response
+
+    response.email = None
+    return response
+
+
+@router.get("/batch", response_model=schemas.UserBatch)
+async def get_users_batch(
+        ids: List[int] = Query(..., description="User ids (repeat the parameter)"),
+        current_user: Optional[schemas.Principal] = Depends(get_current_user),
+        db: DbSession = Depends(replicas.get_read_session)
+):
+    #Повторы id отбрасываются, порядок запроса сохраняется
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > settings.BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many ids. Maximum is {settings.BATCH_MAX_IDS}"
+        )
+
+    db_users = await dal.get_users_by_ids(db, user_ids=ids)
+    found = {db_user.id for db_user in db_users}
+    return {
+        "items": [_visible_user(db_user, current_user) for db_user in db_users],
+        "missing": [user_id for user_id in ids if user_id not in found]
+    }
 
 
 @router.get("/{user_id}", response_model=schemas.UserPublic)
-def get_user(
+async def get_user(
         user_id: int,
-        current_user: Optional[schemas.UserInDB] = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user: Optional[schemas.Principal] = Depends(get_current_user),
+        db: DbSession = Depends(replicas.get_read_session)
 ):
-    db_user = crud.get_user_by_id(db, user_id=user_id)
+    db_user = await dal.get_user_by_id(db, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if current_user:
-        if current_user.id == user_id or current_user.role == schemas.UserRole.ADMIN:
-            return db_user
-
-    response = schemas.UserPublic.model_validate(db_user)
-    response.email = None
-    return response
+    return _visible_user(db_user, current_user)
 
 
 @router.patch("/{user_id}", response_model=schemas.UserPublic)
-def update_user(
+async def update_user(
         user_id: int,
         user_update: schemas.UserUpdate,
-        current_user: schemas.UserInDB = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user: schemas.Principal = Depends(get_current_user),
+        db: DbSession = Depends(get_session)
 ):
     #Проверка прав
     check_user_permission(current_user, user_id=user_id)
 
-    db_user = crud.update_user(db=db, user_id=user_id, user_update=user_update)
+    db_user = await dal.update_user(db=db, user_id=user_id, user_update=user_update)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return db_user
 
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_user(
+async def delete_user(
         user_id: int,
-        current_user: schemas.UserInDB = Depends(get_current_user),
-        db: Session = Depends(get_db)
+        current_user: schemas.Principal = Depends(get_current_user),
+        db: DbSession = Depends(get_session)
 ):
     #Проверка прав
     check_user_permission(current_user, user_id=user_id)
 
-    success = crud.delete_user(db=db, user_id=user_id)
+    success = await dal.delete_user(db=db, user_id=user_id)
     if not success:
         raise HTTPException(status_code=404, detail="User not found")
     return None
\ No newline at end of file
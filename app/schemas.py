@@ -38,16 +38,41 @@ class UserPublic(UserInDB):
     pass
 
 
+# Пакетное чтение по списку id: найденные - в порядке запроса
+class UserBatch(BaseModel):
+    items: List[UserPublic]
+    missing: List[int]
+
+
 # Token Schemas
 class Token(BaseModel):
     access_token: str
     token_type: str = "bearer"
+    refresh_token: Optional[str] = None
+    # Срок жизни access-токена в секундах
+    expires_in: Optional[int] = None
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 
 class TokenData(BaseModel):
     username: Optional[str] = None
     user_id: Optional[int] = None
     role: Optional[UserRole] = None
+    version: Optional[int] = None
+
+
+# Пользователь запроса: из токена (AUTH_STATELESS) или из БД
+class Principal(BaseModel):
+    id: int
+    username: str
+    role: UserRole
+    is_active: bool = True
+    token_version: int = 0
+
+    model_config = ConfigDict(from_attributes=True)
 
 
 # Login Schemas
@@ -80,4 +105,63 @@ class Advertisement(AdvertisementBase):
     owner_id: Optional[int] = None
     created_at: datetime
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+class AdvertisementBatch(BaseModel):
+    items: List[Advertisement]
+    missing: List[int]
+
+# Bulk Schemas
+class AdvertisementBulkCreate(BaseModel):
+    items: List[AdvertisementCreate] = Field(..., min_length=1)
+
+
+class AdvertisementBulkUpdateItem(AdvertisementUpdate):
+    id: int
+
+
+class AdvertisementBulkUpdate(BaseModel):
+    items: List[AdvertisementBulkUpdateItem] = Field(..., min_length=1)
+
+
+class AdvertisementBulkDelete(BaseModel):
+    ids: List[int] = Field(..., min_length=1)
+
+
+class BulkItemStatus(str, Enum):
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+    NOT_FOUND = "not_found"
+    FORBIDDEN = "forbidden"
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    status: BulkItemStatus
+
+
+class BulkResult(BaseModel):
+    results: List[BulkItemResult]
+
+
+# Facets Schemas
+class PriceBucket(BaseModel):
+    min_price: float
+    max_price: float
+    count: int
+
+
+class AuthorCount(BaseModel):
+    author: str
+    count: int
+
+
+class AdvertisementFacets(BaseModel):
+    total: int
+    approximate: bool = False
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    price_histogram: List[PriceBucket]
+    top_authors: List[AuthorCount]
@@ -0,0 +1,65 @@
+import re
+from typing import Optional
+from sqlalchemy import String, bindparam, or_, case, cast, func, literal_column
+from sqlalchemy.dialects.postgresql import REGCONFIG, TSVECTOR
+from app import models
+from app.config import settings
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+search_vector = literal_column("advertisements.search_vector", type_=TSVECTOR)
+
+
+def use_fulltext(db) -> bool:
+    if settings.SEARCH_BACKEND == "basic":
+        return False
+    if settings.SEARCH_BACKEND == "fulltext":
+        return True
+    return db.get_bind().dialect.name == "postgresql"
+
+
+def _prefix_tsquery(search_text: str) -> Optional[str]:
+    # "ноут про" -> "ноут:* & про:*" (совпадение по началу слова)
+    words = _WORD_RE.findall(search_text.lower())
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def search_params(fulltext: bool, search_text: str) -> dict:
+    # Значения параметров для text_filter/relevance
+    if fulltext:
+        return {"search_query": _prefix_tsquery(search_text) or ""}
+    return {"search_pattern": f"%{search_text}%"}
+
+
+def _tsquery():
+    return func.to_tsquery(
+        cast(settings.SEARCH_TS_CONFIG, REGCONFIG),
+        bindparam("search_query", type_=String)
+    )
+
+
+def text_filter(fulltext: bool):
+    if fulltext:
+        return search_vector.op("@@")(_tsquery())
+
+    pattern = bindparam("search_pattern", type_=String)
+    return or_(
+        models.Advertisement.title.ilike(pattern),
+        models.Advertisement.description.ilike(pattern),
+        models.Advertisement.author.ilike(pattern)
+    )
+
+
+def relevance(fulltext: bool):
+    if fulltext:
+        return func.ts_rank_cd(search_vector, _tsquery())
+
+    # Без PostgreSQL: вес совпадения по полям, как setweight A/B/C
+    pattern = bindparam("search_pattern", type_=String)
+    return (
+        case((models.Advertisement.title.ilike(pattern), 4), else_=0)
+        + case((models.Advertisement.author.ilike(pattern), 2), else_=0)
+        + case((models.Advertisement.description.ilike(pattern), 1), else_=0)
+    )
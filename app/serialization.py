@@ -0,0 +1,47 @@
+import gzip
+from typing import Optional, Sequence, Tuple
+import orjson
+from fastapi.responses import JSONResponse
+from app import schemas
+from app.config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Порядок полей как в schemas.Advertisement (и в ответе response_model)
+ADVERTISEMENT_FIELDS = tuple(schemas.Advertisement.model_fields)
+
+
+def _orjson_compatible(price: float) -> bool:
+    # Вне этого диапазона json и orjson по-разному пишут экспоненту (1e+16 / 1e16)
+    return price == 0 or 1e-4 <= abs(price) < 1e16
+
+
+def advertisement_rows_json(rows: Sequence[Sequence]) -> bytes:
+    price_index = ADVERTISEMENT_FIELDS.index("price")
+    if all(_orjson_compatible(row[price_index]) for row in rows):
+        return orjson.dumps(
+            [dict(zip(ADVERTISEMENT_FIELDS, row)) for row in rows],
+            option=orjson.OPT_UTC_Z
+        )
+
+    # Редкий случай - обычный путь FastAPI, байт в байт
+    data = [
+        schemas.Advertisement.model_validate(dict(zip(ADVERTISEMENT_FIELDS, row))).model_dump(mode="json")
+        for row in rows
+    ]
+    return JSONResponse(content=data).body
+
+
+def compress(body: bytes, accept_encoding: Optional[str]) -> Tuple[bytes, Optional[str]]:
+    if not settings.COMPRESSION_MIN_SIZE or len(body) < settings.COMPRESSION_MIN_SIZE:
+        return body, None
+
+    accepted = {item.split(";")[0].strip().lower() for item in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=settings.BROTLI_QUALITY), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=settings.GZIP_LEVEL), "gzip"
+    return body, None
@@ -0,0 +1,93 @@
+import os
+import shutil
+from uvicorn.workers import UvicornWorker
+from app.config import settings
+
+
+class Worker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": "uvloop",
+        "http": "httptools",
+        # После SIGTERM uvicorn перестает принимать соединения и ждет начатые запросы
+        "timeout_graceful_shutdown": settings.SERVER_GRACEFUL_TIMEOUT,
+    }
+
+
+def available_cpus() -> int:
+    # Учитывает привязку к ядрам и квоту cgroup v2 (docker --cpus)
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def worker_count() -> int:
+    return settings.WEB_CONCURRENCY or available_cpus()
+
+
+def _reset_metrics_directory():
+    # Файлы метрик прошлого запуска искажают счетчики; чистим до загрузки приложения
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def on_starting(server):
+    from app.database import pool_options
+    server.log.info("Workers: %d, DB pool per worker: %s", settings.WEB_CONCURRENCY, pool_options())
+
+
+def post_fork(server, worker):
+    # Приложение загружено в мастере (preload): соединения, открытые там,
+    # не должны использоваться из нескольких процессов
+    from app.database import async_engine, engine
+    engine.dispose(close=False)
+    if async_engine is not None:
+        async_engine.sync_engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    from app import metrics
+    metrics.mark_process_dead(worker.pid)
+
+
+def run():
+    from gunicorn.app.base import BaseApplication
+
+    workers = worker_count()
+    # Размер пула соединений каждого воркера считается от числа воркеров
+    settings.WEB_CONCURRENCY = workers
+    _reset_metrics_directory()
+
+    class Application(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{settings.SERVER_HOST}:{settings.SERVER_PORT}",
+                "workers": workers,
+                "worker_class": "app.server.Worker",
+                "preload_app": True,
+                "backlog": settings.SERVER_BACKLOG,
+                "keepalive": settings.SERVER_KEEPALIVE,
+                "graceful_timeout": settings.SERVER_GRACEFUL_TIMEOUT,
+                "timeout": settings.SERVER_WORKER_TIMEOUT,
+                "on_starting": on_starting,
+                "post_fork": post_fork,
+                "child_exit": child_exit,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app.main import app
+            return app
+
+    Application().run()
@@ -0,0 +1,39 @@
+# Сравнение двух прогонов bench.run:
+#     python -m bench.compare before.json after.json
+import argparse
+import json
+
+METRICS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+
+
+def _delta(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    for name, result in after["scenarios"].items():
+        previous = before["scenarios"].get(name)
+        if previous is None:
+            continue
+        columns = "  ".join(
+            f"{metric} {previous[metric]:.2f} -> {result[metric]:.2f} ({_delta(previous[metric], result[metric])})"
+            for metric in METRICS
+        )
+        print(f"{name:24} {columns}")
+
+
+if __name__ == "__main__":
+    main()
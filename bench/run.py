@@ -0,0 +1,151 @@
+# Нагрузочные сценарии против приложения в процессе (ASGI) или запущенного сервера:
+#     python -m bench.run --scenarios ad_detail,search_default --duration 10 --concurrency 16
+#     python -m bench.run --target http://localhost:8000 --output results.json
+# Результат - JSON с p50/p95/p99 и пропускной способностью по каждому сценарию.
+# Сценарий login с одного адреса упирается в лимит попыток входа:
+# для замеров запускайте сервер с LOGIN_RATE_LIMIT_ENABLED=false
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import List, Optional
+import httpx
+from bench.scenarios import SCENARIOS, Context
+
+IN_PROCESS = "inprocess"
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    # Метод ближайшего ранга
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+async def run_scenario(ctx: Context, name: str, duration: float, concurrency: int, warmup: float) -> dict:
+    scenario = SCENARIOS[name]
+    latencies: List[float] = []
+    errors = 0
+
+    async def worker(deadline: float, record: bool):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await scenario(ctx)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            if record:
+                latencies.append(time.perf_counter() - start)
+                errors += failed
+
+    if warmup:
+        deadline = time.perf_counter() + warmup
+        await asyncio.gather(*(worker(deadline, False) for _ in range(concurrency)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(started + duration, True) for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@asynccontextmanager
+async def open_client(target: str, concurrency: int):
+    timeout = httpx.Timeout(60.0)
+    if target == IN_PROCESS:
+        from app.main import app
+        # ASGITransport не запускает lifespan сам
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=timeout) as client:
+                yield client
+    else:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=target, limits=limits, timeout=timeout) as client:
+            yield client
+
+
+async def main_async(args) -> dict:
+    names = list(SCENARIOS) if args.scenarios == "all" else args.scenarios.split(",")
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {unknown}. Available: {list(SCENARIOS)}")
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "target": args.target,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+        },
+        "scenarios": {},
+    }
+    async with open_client(args.target, args.concurrency) as client:
+        ctx = Context(client, users=args.users, writers=args.writers, seed=args.seed)
+        await ctx.prepare()
+        for name in names:
+            summary = await run_scenario(ctx, name, args.duration, args.concurrency, args.warmup)
+            results["scenarios"][name] = summary
+            print(
+                f"{name:24} {summary['throughput_rps']:10.1f} rps  p50 {summary['p50_ms']:8.2f}ms  "
+                f"p95 {summary['p95_ms']:8.2f}ms  p99 {summary['p99_ms']:8.2f}ms  errors {summary['errors']}",
+                file=sys.stderr
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run benchmark scenarios")
+    parser.add_argument("--target", default=IN_PROCESS, help=f"'{IN_PROCESS}' or server URL")
+    parser.add_argument("--scenarios", default="all", help=f"comma-separated: {', '.join(SCENARIOS)}")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=1.0, help="unrecorded seconds before each scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=1000, help="number of seeded bench users to pick from")
+    parser.add_argument("--writers", type=int, default=8, help="users logged in up front for write scenarios")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--output", help="write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
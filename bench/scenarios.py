@@ -0,0 +1,142 @@
+import random
+from typing import Awaitable, Callable, Dict, List
+import httpx
+from bench.seed import PASSWORD, USER_PREFIX
+
+
+class Context:
+    # Общие данные сценариев: токены bench-пользователей и id существующих объявлений
+    def __init__(self, client: httpx.AsyncClient, users: int, writers: int = 8, seed: int = 0):
+        self.client = client
+        self.users = users
+        self.rng = random.Random(seed)
+        # Пишущие сценарии работают от имени этих пользователей: вход выполняется
+        # заранее, чтобы bcrypt не попадал в замеры create/patch/delete
+        self.writers = [f"{USER_PREFIX}{n}" for n in range(min(users, writers))]
+        self.tokens: Dict[str, str] = {}
+        self.advertisement_ids: List[int] = []
+        self.owned_ids: Dict[str, List[int]] = {}
+
+    def username(self) -> str:
+        return f"{USER_PREFIX}{self.rng.randrange(self.users)}"
+
+    def writer(self) -> str:
+        return self.rng.choice(self.writers)
+
+    async def token(self, username: str) -> str:
+        if username not in self.tokens:
+            response = await self.client.post("/login", json={"username": username, "password": PASSWORD})
+            response.raise_for_status()
+            self.tokens[username] = response.json()["access_token"]
+        return self.tokens[username]
+
+    async def headers(self, username: str) -> dict:
+        return {"Authorization": f"Bearer {await self.token(username)}"}
+
+    async def prepare(self, sample: int = 1000):
+        response = await self.client.get("/advertisement/", params={"limit": sample})
+        response.raise_for_status()
+        self.advertisement_ids = [advertisement["id"] for advertisement in response.json()]
+        if not self.advertisement_ids:
+            raise SystemExit("No advertisements found, run python -m bench.seed first")
+        for username in self.writers:
+            await self.token(username)
+
+
+Scenario = Callable[[Context], Awaitable[httpx.Response]]
+
+
+async def login(ctx: Context):
+    return await ctx.client.post("/login", json={"username": ctx.username(), "password": PASSWORD})
+
+
+async def ad_detail(ctx: Context):
+    return await ctx.client.get(f"/advertisement/{ctx.rng.choice(ctx.advertisement_ids)}")
+
+
+def _search(**params) -> Scenario:
+    async def scenario(ctx: Context):
+        return await ctx.client.get("/advertisement/", params=params)
+    return scenario
+
+
+async def search_cursor(ctx: Context):
+    # Первая страница и переход по курсору
+    response = await ctx.client.get("/advertisement/", params={"limit": 50})
+    cursor = response.headers.get("x-next-cursor")
+    if cursor is None:
+        return response
+    return await ctx.client.get("/advertisement/", params={"limit": 50, "cursor": cursor})
+
+
+async def search_author(ctx: Context):
+    return await ctx.client.get("/advertisement/", params={"author": ctx.username(), "limit": 50})
+
+
+async def search_random_price(ctx: Context):
+    # Разные диапазоны - мимо кэша поиска
+    low = ctx.rng.randint(1, 50000)
+    return await ctx.client.get(
+        "/advertisement/",
+        params={"min_price": low, "max_price": low + 1000, "sort_by": "price", "sort_order": "asc", "limit": 50}
+    )
+
+
+def _advertisement(ctx: Context) -> dict:
+    return {
+        "title": f"bench {ctx.rng.randrange(10 ** 9)}",
+        "description": "benchmark advertisement",
+        "price": ctx.rng.randint(1, 100000),
+        "author": "bench",
+    }
+
+
+async def create(ctx: Context):
+    username = ctx.writer()
+    response = await ctx.client.post("/advertisement/", json=_advertisement(ctx), headers=await ctx.headers(username))
+    if response.status_code == 201:
+        ctx.owned_ids.setdefault(username, []).append(response.json()["id"])
+    return response
+
+
+async def _owned(ctx: Context):
+    # Объявление, созданное этим же пользователем (создается при необходимости)
+    username = ctx.writer()
+    headers = await ctx.headers(username)
+    owned = ctx.owned_ids.setdefault(username, [])
+    if not owned:
+        response = await ctx.client.post("/advertisement/", json=_advertisement(ctx), headers=headers)
+        response.raise_for_status()
+        owned.append(response.json()["id"])
+    return owned, headers
+
+
+async def patch(ctx: Context):
+    owned, headers = await _owned(ctx)
+    return await ctx.client.patch(
+        f"/advertisement/{ctx.rng.choice(owned)}",
+        json={"price": ctx.rng.randint(1, 100000)},
+        headers=headers
+    )
+
+
+async def delete(ctx: Context):
+    owned, headers = await _owned(ctx)
+    return await ctx.client.delete(f"/advertisement/{owned.pop()}", headers=headers)
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "login": login,
+    "ad_detail": ad_detail,
+    "search_default": _search(limit=50),
+    "search_price_range": _search(min_price=100, max_price=5000, limit=50),
+    "search_random_price": search_random_price,
+    "search_text": _search(search_text="ноутбук", limit=50),
+    "search_text_relevance": _search(search_text="продам ноутбук", sort_by="relevance", limit=50),
+    "search_title_sort": _search(title="ноутбук", sort_by="title", sort_order="asc", limit=50),
+    "search_author": search_author,
+    "search_cursor": search_cursor,
+    "create": create,
+    "patch": patch,
+    "delete": delete,
+}
@@ -0,0 +1,185 @@
+# Синтетические данные для нагрузочных тестов:
+#     python -m bench.seed --users 10000 --ads 10000000
+# На PostgreSQL строки идут через COPY потоком из генератора, на остальных БД -
+# пачками executemany. Пароль всех пользователей - PASSWORD (хэш считается один раз)
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List
+from sqlalchemy import func, insert, select, text
+from app import models
+from app.crud import _copy_text_value
+from app.database import engine
+from app.hashing import pwd_context
+
+PASSWORD = "benchpass123"
+USER_PREFIX = "bench_user_"
+
+WORDS = (
+    "продам куплю сдам обменяю ноутбук велосипед квартира телефон диван шкаф "
+    "машина гараж дача собака кошка книга гитара пианино часы куртка коляска "
+    "холодильник стиральная машина телевизор камера объектив монитор принтер "
+    "новый б/у срочно недорого отличный состояние гарантия доставка торг центр"
+).split()
+
+
+class _CopyReader:
+    # Файлоподобный объект для copy_expert: строки COPY из генератора, без буфера на всю таблицу
+    def __init__(self, lines: Iterator[str]):
+        self._lines = lines
+
+    def read(self, size: int = -1) -> bytes:
+        # Отдает примерно size байт целыми строками (copy_expert не требует точного размера)
+        parts, length = [], 0
+        for line in self._lines:
+            encoded = line.encode("utf-8")
+            parts.append(encoded)
+            length += len(encoded)
+            if 0 <= size <= length:
+                break
+        return b"".join(parts)
+
+    readline = read
+
+
+def user_rows(start: int, stop: int, hashed_password: str) -> Iterator[dict]:
+    for n in range(start, stop):
+        yield {
+            "username": f"{USER_PREFIX}{n}",
+            "email": f"{USER_PREFIX}{n}@bench.example.com",
+            "hashed_password": hashed_password,
+            "is_active": True,
+            "role": models.UserRole.USER.name,
+        }
+
+
+def advertisement_rows(count: int, owners: List[tuple], seed: int) -> Iterator[dict]:
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    for _ in range(count):
+        owner_id, username = rng.choice(owners)
+        yield {
+            "title": " ".join(rng.choices(WORDS, k=rng.randint(2, 5))),
+            "description": " ".join(rng.choices(WORDS, k=rng.randint(5, 30))),
+            # Логнормальное распределение цен: много дешевых, длинный хвост
+            "price": round(rng.lognormvariate(8, 1.5), 2) + 1,
+            "author": username,
+            "owner_id": owner_id,
+            "created_at": now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600)),
+        }
+
+
+def _copy(connection, table: str, rows: Iterator[dict], columns: tuple):
+    lines = (
+        "\t".join(_copy_text_value(row[column]) for column in columns) + "\n"
+        for row in rows
+    )
+    cursor = connection.connection.driver_connection.cursor()
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT text)",
+        _CopyReader(lines),
+        size=1 << 20
+    )
+
+
+def _insert(connection, table, rows: Iterator[dict], batch_size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            connection.execute(insert(table), batch)
+            batch = []
+    if batch:
+        connection.execute(insert(table), batch)
+
+
+def _chain(first: dict, rows: Iterator[dict]) -> Iterator[dict]:
+    yield first
+    yield from rows
+
+
+def load(rows: Iterator[dict], table, batch_size: int):
+    with engine.begin() as connection:
+        if engine.dialect.driver == "psycopg2":
+            first = next(rows, None)
+            if first is None:
+                return
+            _copy(connection, table.name, _chain(first, rows), tuple(first))
+        else:
+            _insert(connection, table, rows, batch_size)
+
+
+def _drop_indexes(table: str) -> List[str]:
+    # Построить индекс один раз после загрузки быстрее, чем обновлять его на каждой строке
+    with engine.begin() as connection:
+        indexes = connection.execute(
+            text("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = :table AND indexname NOT LIKE '%%_pkey'"),
+            {"table": table}
+        ).all()
+        for name, _ in indexes:
+            connection.execute(text(f'DROP INDEX "{name}"'))
+    return [definition for _, definition in indexes]
+
+
+def _create_indexes(definitions: List[str]):
+    with engine.begin() as connection:
+        for definition in definitions:
+            connection.execute(text(definition))
+
+
+def seed(users: int, ads: int, batch_size: int = 10000, random_seed: int = 42, defer_indexes: bool = False):
+    started = time.perf_counter()
+    with engine.connect() as connection:
+        existing = connection.execute(
+            select(func.count()).select_from(models.User).where(models.User.username.like(f"{USER_PREFIX}%"))
+        ).scalar()
+    if users > existing:
+        load(user_rows(existing, users, pwd_context.hash(PASSWORD)), models.User.__table__, batch_size)
+    print(f"users: {max(users, existing)} ({time.perf_counter() - started:.1f}s)")
+
+    with engine.connect() as connection:
+        owners = connection.execute(
+            select(models.User.id, models.User.username).where(models.User.username.like(f"{USER_PREFIX}%"))
+        ).all()
+    if not owners:
+        raise SystemExit("No bench users to own advertisements")
+
+    started = time.perf_counter()
+    deferred = []
+    if defer_indexes and engine.dialect.name == "postgresql":
+        deferred = _drop_indexes(models.Advertisement.__tablename__)
+    load(
+        advertisement_rows(ads, [tuple(owner) for owner in owners], random_seed),
+        models.Advertisement.__table__,
+        batch_size
+    )
+    print(f"advertisements: +{ads} ({time.perf_counter() - started:.1f}s)")
+    if deferred:
+        started = time.perf_counter()
+        _create_indexes(deferred)
+        print(f"indexes: {len(deferred)} ({time.perf_counter() - started:.1f}s)")
+
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("VACUUM ANALYZE users"))
+            connection.execute(text("VACUUM ANALYZE advertisements"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed users and advertisements for benchmarks")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--ads", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=10000, help="executemany batch size (non-PostgreSQL)")
+    parser.add_argument("--seed", type=int, default=42, help="random seed")
+    parser.add_argument(
+        "--defer-indexes",
+        action="store_true",
+        help="PostgreSQL: drop advertisement indexes before COPY and rebuild them afterwards"
+    )
+    args = parser.parse_args()
+    seed(args.users, args.ads, args.batch_size, args.seed, args.defer_indexes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# Микробенчмарк построения запросов в горячих функциях crud: запрос, собираемый
+# на каждый вызов, против lambda_stmt / готового select() с параметрами.
+#     python -m bench.statements --iterations 5000
+#     DB_ASYNC=true python -m bench.statements
+# build - построение запроса и ключа кэша компиляции (без БД), call - вызов целиком.
+# Нужны данные в БД (python -m bench.seed или хотя бы один пользователь и объявление)
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Callable, Dict
+from sqlalchemy import select
+from app import crud, models
+from app.config import settings
+from app.database import AsyncSessionLocal, SessionLocal
+
+SEARCH_PARAMS = {"min_price": 10.0, "max_price": 20.0, "limit": 20, "sort_by": "price", "sort_order": "asc"}
+
+
+def build_cases(user: models.User, advertisement_id: int) -> Dict[str, Dict[str, Callable]]:
+    # rebuilt - запрос строится заново при каждом вызове (как select() в прежнем
+    # crud_async; db.query() прежнего crud еще медленнее)
+    return {
+        "get_user_by_id": {
+            "rebuilt": lambda db: select(models.User).where(models.User.id == user.id),
+            "cached": lambda db: crud.user_by_id_statement(user.id),
+        },
+        "get_user_by_username": {
+            "rebuilt": lambda db: select(models.User).where(models.User.username == user.username),
+            "cached": lambda db: crud.user_by_username_statement(user.username),
+        },
+        "get_advertisement": {
+            "rebuilt": lambda db: select(models.Advertisement).where(models.Advertisement.id == advertisement_id),
+            "cached": lambda db: crud.advertisement_by_id_statement(advertisement_id),
+        },
+        "search_advertisements": {
+            "rebuilt": lambda db: _rebuilt_search(db),
+            "cached": lambda db: crud.search_advertisements_statement(db, **SEARCH_PARAMS),
+        },
+    }
+
+
+def _rebuilt_search(db):
+    crud._search_statements.clear()
+    return crud.search_advertisements_statement(db, **SEARCH_PARAMS)
+
+
+def measure(function: Callable, iterations: int) -> float:
+    for _ in range(min(200, iterations)):
+        function()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+async def measure_async(function: Callable, iterations: int) -> float:
+    for _ in range(min(200, iterations)):
+        await function()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await function()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def _build(case: Callable, db):
+    built = case(db)
+    statement = built[0] if isinstance(built, tuple) else built
+    return statement._generate_cache_key()
+
+
+def _execute(case: Callable, db):
+    built = case(db)
+    if isinstance(built, tuple):
+        return db.execute(*built).all()
+    return db.execute(built).all()
+
+
+async def _execute_async(case: Callable, db):
+    built = case(db)
+    if isinstance(built, tuple):
+        return (await db.execute(*built)).all()
+    return (await db.execute(built)).all()
+
+
+def run_sync(iterations: int) -> dict:
+    results = {}
+    with SessionLocal() as db:
+        user = db.execute(select(models.User).order_by(models.User.id).limit(1)).scalars().first()
+        advertisement_id = db.execute(select(models.Advertisement.id).limit(1)).scalar()
+        if user is None or advertisement_id is None:
+            raise SystemExit("Database is empty, run python -m bench.seed first")
+        for name, variants in build_cases(user, advertisement_id).items():
+            results[name] = {
+                f"{variant}_{kind}_us": round(measure(lambda: action(case, db), iterations), 2)
+                for variant, case in variants.items()
+                for kind, action in (("build", _build), ("call", _execute))
+            }
+    return results
+
+
+async def run_async(iterations: int) -> dict:
+    results = {}
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(models.User).order_by(models.User.id).limit(1))).scalars().first()
+        advertisement_id = (await db.execute(select(models.Advertisement.id).limit(1))).scalar()
+        if user is None or advertisement_id is None:
+            raise SystemExit("Database is empty, run python -m bench.seed first")
+        for name, variants in build_cases(user, advertisement_id).items():
+            results[name] = {}
+            for variant, case in variants.items():
+                results[name][f"{variant}_build_us"] = round(measure(lambda: _build(case, db), iterations), 2)
+                results[name][f"{variant}_call_us"] = round(
+                    await measure_async(lambda: _execute_async(case, db), iterations), 2
+                )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare rebuilt and cached crud statements")
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    if settings.DB_ASYNC:
+        results = asyncio.run(run_async(args.iterations))
+    else:
+        results = run_sync(args.iterations)
+
+    for name, timings in results.items():
+        print(
+            f"{name:24} build {timings['rebuilt_build_us']:8.1f} -> {timings['cached_build_us']:8.1f} us   "
+            f"call {timings['rebuilt_call_us']:8.1f} -> {timings['cached_call_us']:8.1f} us",
+            file=sys.stderr
+        )
+    print(json.dumps({"db_async": settings.DB_ASYNC, "iterations": args.iterations, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+from alembic import context, op
+
+
+# alembic -x concurrently=true upgrade head: индексы строятся через
+# CREATE INDEX CONCURRENTLY вне транзакции, не блокируя запись в таблицу
+def concurrently() -> bool:
+    value = context.get_x_argument(as_dictionary=True).get("concurrently", "")
+    return value.lower() in ("1", "true", "yes") and op.get_bind().dialect.name == "postgresql"
+
+
+def create_index(name: str, table: str, columns: list, **kw):
+    if concurrently():
+        # Прерванная сборка оставляет INVALID-индекс: его нужно удалить
+        # (DROP INDEX CONCURRENTLY) и повторить миграцию
+        with op.get_context().autocommit_block():
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True, **kw)
+    else:
+        op.create_index(name, table, columns, **kw)
+
+
+def drop_index(name: str, table: str):
+    if concurrently():
+        with op.get_context().autocommit_block():
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+    else:
+        op.drop_index(name, table_name=table)
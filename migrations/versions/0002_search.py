@@ -0,0 +1,62 @@
+"""full-text search: search_vector + GIN, trigram indexes (PostgreSQL only)
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.config import settings
+from migrations.online import create_index, drop_index
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+TRGM_COLUMNS = ("title", "author", "description")
+
+
+def _has_pg_trgm(bind) -> bool:
+    return bind.execute(
+        sa.text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    ).first() is not None
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    op.execute(
+        "ALTER TABLE advertisements ADD COLUMN search_vector tsvector "
+        "GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('{cfg}', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('{cfg}', coalesce(author, '')), 'B') || "
+        "setweight(to_tsvector('{cfg}', coalesce(description, '')), 'C')"
+        ") STORED".format(cfg=settings.SEARCH_TS_CONFIG)
+    )
+    create_index("ix_advertisements_search_vector", "advertisements", ["search_vector"], postgresql_using="gin")
+
+    if _has_pg_trgm(bind):
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for column in TRGM_COLUMNS:
+            create_index(
+                f"ix_advertisements_{column}_trgm",
+                "advertisements",
+                [column],
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"}
+            )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+
+    for column in TRGM_COLUMNS:
+        op.execute(f"DROP INDEX IF EXISTS ix_advertisements_{column}_trgm")
+    drop_index("ix_advertisements_search_vector", "advertisements")
+    op.drop_column("advertisements", "search_vector")
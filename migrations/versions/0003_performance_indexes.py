@@ -0,0 +1,35 @@
+"""indexes for keyset pagination, price filters, owner lookups and author matching
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+
+На больших таблицах: alembic -x concurrently=true upgrade head
+"""
+import sqlalchemy as sa
+from migrations.online import create_index, drop_index
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    # ORDER BY created_at, id / WHERE (created_at, id) > курсор
+    ("ix_advertisements_created_at_id", ["created_at", "id"]),
+    # min_price/max_price и сортировка по цене
+    ("ix_advertisements_price_id", ["price", "id"]),
+    ("ix_advertisements_owner_id", ["owner_id"]),
+    ("ix_advertisements_author_lower", [sa.text("lower(author)")]),
+)
+
+
+def upgrade():
+    for name, columns in INDEXES:
+        create_index(name, "advertisements", columns)
+
+
+def downgrade():
+    for name, _ in reversed(INDEXES):
+        drop_index(name, "advertisements")
@@ -1,10 +1,26 @@
+import argparse
+import os
 import uvicorn
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host="localhost",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Advertisement Service")
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        help="gunicorn with uvicorn workers (uvloop, httptools), settings from .env"
+    )
+    args = parser.parse_args()
+
+    if args.production:
+        from app import server
+        server.run()
+    else:
+        # Один процесс uvicorn: уведомления между воркерами не нужны
+        os.environ.setdefault("SINGLE_PROCESS", "true")
+        uvicorn.run(
+            "app.main:app",
+            host="localhost",
+            port=8000,
+            reload=True,
+            log_level="info"
+        )
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Настройки читаются при импорте app: отдельная SQLite-база, без кэшей,
+# пула хэширования и ограничения попыток входа
+_db_dir = tempfile.mkdtemp(prefix="advertisements-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_db_dir, "test.db")
+os.environ["DB_ASYNC"] = "false"
+os.environ["HASH_POOL_WORKERS"] = "0"
+os.environ["PASSWORD_HASH_ROUNDS"] = "4"
+os.environ["LOGIN_RATE_LIMIT_ENABLED"] = "false"
+os.environ["SEARCH_CACHE_SIZE"] = "0"
+os.environ["AD_CACHE_SIZE"] = "0"
+os.environ["PRINCIPAL_CACHE_SIZE"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from app import models  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.main import app  # noqa: E402
+
+Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    session.query(models.Advertisement).delete()
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,118 @@
+import itertools
+
+import pytest
+from sqlalchemy import update
+
+from app import events, models
+from app.database import SessionLocal
+
+_names = itertools.count(1)
+
+
+def _user_headers(client, admin: bool = False) -> dict:
+    username = f"ad_user_{next(_names)}"
+    response = client.post(
+        "/user/", json={"username": username, "password": "secret123", "email": f"{username}@example.com"}
+    )
+    assert response.status_code == 201, response.text
+    if admin:
+        with SessionLocal() as db:
+            db.execute(
+                update(models.User).where(models.User.username == username).values(role=models.UserRole.ADMIN)
+            )
+            db.commit()
+    response = client.post("/login", json={"username": username, "password": "secret123"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": "Bearer " + response.json()["access_token"]}
+
+
+@pytest.fixture
+def owner(client, db):
+    return _user_headers(client)
+
+
+@pytest.fixture
+def advertisement(client, owner):
+    response = client.post(
+        "/advertisement/", json={"title": "bike", "description": "red", "price": 100.0, "author": "seller"},
+        headers=owner
+    )
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+@pytest.fixture
+def published(monkeypatch):
+    # События, отправленные записью (тип и id объявлений)
+    calls = []
+    publish = events.publish
+
+    def spy(db, event_type, rows):
+        calls.append((event_type, [row.id for row in rows]))
+        return publish(db, event_type, rows)
+
+    monkeypatch.setattr(events, "publish", spy)
+    return calls
+
+
+def test_owner_can_update(client, owner, advertisement, published):
+    response = client.patch(f"/advertisement/{advertisement['id']}", json={"price": 150.0}, headers=owner)
+    assert response.status_code == 200, response.text
+    assert response.json()["price"] == 150.0
+    assert client.get(f"/advertisement/{advertisement['id']}").json()["price"] == 150.0
+    assert published == [(events.UPDATED, [advertisement["id"]])]
+
+
+def test_non_owner_cannot_update(client, advertisement, published):
+    response = client.patch(f"/advertisement/{advertisement['id']}", json={"price": 1.0}, headers=_user_headers(client))
+    assert response.status_code == 403, response.text
+    assert client.get(f"/advertisement/{advertisement['id']}").json()["price"] == 100.0
+    assert published == []
+
+
+def test_update_missing_advertisement(client, owner):
+    response = client.patch("/advertisement/999999", json={"price": 1.0}, headers=owner)
+    assert response.status_code == 404, response.text
+
+
+def test_admin_can_update_any_advertisement(client, advertisement):
+    response = client.patch(
+        f"/advertisement/{advertisement['id']}", json={"title": "moderated"}, headers=_user_headers(client, admin=True)
+    )
+    assert response.status_code == 200, response.text
+    assert client.get(f"/advertisement/{advertisement['id']}").json()["title"] == "moderated"
+
+
+def test_empty_update_returns_unchanged_row_without_event(client, owner, advertisement, published):
+    response = client.patch(f"/advertisement/{advertisement['id']}", json={}, headers=owner)
+    assert response.status_code == 200, response.text
+    assert response.json() == advertisement
+    assert published == []
+
+
+def test_empty_update_still_checks_owner(client, advertisement):
+    response = client.patch(f"/advertisement/{advertisement['id']}", json={}, headers=_user_headers(client))
+    assert response.status_code == 403, response.text
+
+
+def test_owner_can_delete(client, owner, advertisement, published):
+    assert client.delete(f"/advertisement/{advertisement['id']}", headers=owner).status_code == 204
+    assert client.get(f"/advertisement/{advertisement['id']}").status_code == 404
+    assert published == [(events.DELETED, [advertisement["id"]])]
+
+
+def test_non_owner_cannot_delete(client, advertisement, published):
+    response = client.delete(f"/advertisement/{advertisement['id']}", headers=_user_headers(client))
+    assert response.status_code == 403, response.text
+    assert client.get(f"/advertisement/{advertisement['id']}").status_code == 200
+    assert published == []
+
+
+def test_delete_missing_advertisement(client, owner):
+    assert client.delete("/advertisement/999999", headers=owner).status_code == 404
+
+
+def test_admin_can_delete_any_advertisement(client, advertisement):
+    response = client.delete(f"/advertisement/{advertisement['id']}", headers=_user_headers(client, admin=True))
+    assert response.status_code == 204, response.text
+    assert client.get(f"/advertisement/{advertisement['id']}").status_code == 404
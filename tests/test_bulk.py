@@ -0,0 +1,47 @@
+import pytest
+
+
+@pytest.fixture
+def headers(client, db):
+    user = {"username": "bulk_owner", "password": "secret123", "email": "bulk_owner@example.com"}
+    client.post("/user/", json=user)
+    response = client.post("/login", json={"username": user["username"], "password": user["password"]})
+    assert response.status_code == 200, response.text
+    return {"Authorization": "Bearer " + response.json()["access_token"]}
+
+
+def test_bulk_create_returns_ids_in_request_order(client, headers):
+    items = [{"title": f"item {i}", "price": i + 0.5, "author": "seller"} for i in range(5)]
+    response = client.post("/advertisement/bulk", json={"items": items}, headers=headers)
+    assert response.status_code == 201, response.text
+    results = response.json()["results"]
+    assert [result["index"] for result in results] == list(range(5))
+    for item, result in zip(items, results):
+        assert client.get(f"/advertisement/{result['id']}").json()["title"] == item["title"]
+
+
+def test_bulk_update_applies_items_in_request_order(client, headers):
+    items = [{"title": f"item {i}", "price": 1.0, "author": "seller", "description": "text"} for i in range(3)]
+    first, second, third = [
+        result["id"] for result in
+        client.post("/advertisement/bulk", json={"items": items}, headers=headers).json()["results"]
+    ]
+
+    updates = [
+        {"id": first, "price": 10.0},
+        {"id": second, "title": "renamed", "description": None},
+        {"id": first, "price": 20.0, "author": "other"},
+        {"id": first, "price": 30.0},
+        {"id": 999999, "price": 1.0},
+    ]
+    response = client.patch("/advertisement/bulk", json={"items": updates}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert [result["status"] for result in response.json()["results"]] == [
+        "updated", "updated", "updated", "updated", "not_found"
+    ]
+
+    advertisement = client.get(f"/advertisement/{first}").json()
+    assert (advertisement["price"], advertisement["author"]) == (30.0, "other")
+    advertisement = client.get(f"/advertisement/{second}").json()
+    assert (advertisement["title"], advertisement["description"]) == ("renamed", None)
+    assert client.get(f"/advertisement/{third}").json()["price"] == 1.0
@@ -0,0 +1,56 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app import dal, events, hashing
+from app.main import app
+from app.metrics import REGISTRY
+
+AD_ROUTE = "/advertisement/{advertisement_id}"
+EVENTS_ROUTE = "/advertisement/events"
+
+
+def _sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def _raising(exc):
+    async def get_advertisement(*args, **kwargs):
+        raise exc
+    return get_advertisement
+
+
+@pytest.mark.parametrize("exc", [hashing.HashingPoolBusy(), PoolTimeoutError("pool exhausted")])
+def test_handled_exception_is_counted_with_handler_status(client, monkeypatch, exc):
+    monkeypatch.setattr(dal, "get_advertisement", _raising(exc))
+    before = _sample("http_responses_total", method="GET", route=AD_ROUTE, status="503")
+    errors = _sample("http_responses_total", method="GET", route=AD_ROUTE, status="500")
+
+    assert client.get("/advertisement/1").status_code == 503
+    assert _sample("http_responses_total", method="GET", route=AD_ROUTE, status="503") == before + 1
+    assert _sample("http_responses_total", method="GET", route=AD_ROUTE, status="500") == errors
+
+
+def test_unhandled_exception_is_counted_as_500(client, monkeypatch):
+    monkeypatch.setattr(dal, "get_advertisement", _raising(RuntimeError("boom")))
+    before = _sample("http_responses_total", method="GET", route=AD_ROUTE, status="500")
+
+    assert TestClient(app, raise_server_exceptions=False).get("/advertisement/1").status_code == 500
+    assert _sample("http_responses_total", method="GET", route=AD_ROUTE, status="500") == before + 1
+
+
+def test_event_stream_is_not_timed(client, monkeypatch):
+    async def stream(subscriber, last_event_id):
+        yield b"retry: 1000\n\n"
+
+    monkeypatch.setattr(events, "stream", stream)
+    before = _sample("http_responses_total", method="GET", route=EVENTS_ROUTE, status="200")
+
+    assert client.get("/advertisement/events").status_code == 200
+    assert _sample("http_responses_total", method="GET", route=EVENTS_ROUTE, status="200") == before + 1
+    assert REGISTRY.get_sample_value(
+        "http_request_duration_seconds_count", {"method": "GET", "route": EVENTS_ROUTE}
+    ) is None
+    assert REGISTRY.get_sample_value(
+        "http_requests_in_progress", {"method": "GET", "route": EVENTS_ROUTE}
+    ) is None
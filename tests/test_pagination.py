@@ -0,0 +1,128 @@
+import asyncio
+import base64
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from app import dal, models
+from app.database import engine
+from app.pagination import decode_cursor, encode_cursor
+
+SORT_FIELDS = ["title", "price", "created_at", "author"]
+ORDERS = ["asc", "desc"]
+PAGE = 3
+
+
+@pytest.fixture
+def advertisements(db):
+    # Одинаковые значения сортировки (порядок задает id), created_at по умолчанию
+    # (CURRENT_TIMESTAMP, без долей секунды) и заданные явно - с микросекундами и без
+    for i in range(20):
+        created_at = None
+        if i % 4 == 1:
+            created_at = datetime(2026, 10, 18, 21, 14, 41)
+        elif i % 4 == 2:
+            created_at = datetime(2026, 10, 18, 21, 14, 41, 250000 + i)
+        db.add(models.Advertisement(
+            title=f"ad {i % 7}", description="text", price=float(i % 5 + 1), author=f"author {i % 3}",
+            owner_id=1, created_at=created_at
+        ))
+    db.commit()
+
+
+def _walk(client, sort_by, sort_order):
+    ids, cursor = [], None
+    while True:
+        params = {"sort_by": sort_by, "sort_order": sort_order, "limit": PAGE}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/advertisement/", params=params)
+        assert response.status_code == 200, response.text
+        ids += [advertisement["id"] for advertisement in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            return ids
+        assert len(ids) <= 20
+
+
+@pytest.mark.parametrize("sort_order", ORDERS)
+@pytest.mark.parametrize("sort_by", SORT_FIELDS)
+def test_cursor_walk_matches_unpaged_list(client, advertisements, sort_by, sort_order):
+    response = client.get("/advertisement/", params={"sort_by": sort_by, "sort_order": sort_order, "limit": 1000})
+    unpaged = [advertisement["id"] for advertisement in response.json()]
+    assert len(unpaged) == 20
+    assert _walk(client, sort_by, sort_order) == unpaged
+
+
+async def _walk_async(sort_by, sort_order):
+    async_engine = create_async_engine(str(engine.url.set(drivername="sqlite+aiosqlite")))
+    try:
+        async with AsyncSession(async_engine) as db:
+            unpaged = [
+                advertisement.id for advertisement in
+                await dal.search_advertisements(db, limit=1000, sort_by=sort_by, sort_order=sort_order)
+            ]
+            ids, after = [], None
+            while True:
+                page = await dal.search_advertisements(
+                    db, limit=PAGE, sort_by=sort_by, sort_order=sort_order, after=after
+                )
+                ids += [advertisement.id for advertisement in page]
+                if len(page) < PAGE:
+                    return ids, unpaged
+                # Через курсор, как в маршруте: дата проходит через isoformat
+                last = page[-1]
+                cursor = encode_cursor(sort_by, sort_order, getattr(last, sort_by), last.id)
+                after = decode_cursor(cursor, sort_by, sort_order)
+                assert len(ids) <= 20
+    finally:
+        await async_engine.dispose()
+
+
+@pytest.mark.parametrize("sort_order", ORDERS)
+@pytest.mark.parametrize("sort_by", SORT_FIELDS)
+def test_async_cursor_walk_matches_unpaged_list(advertisements, sort_by, sort_order):
+    pytest.importorskip("aiosqlite")
+    ids, unpaged = asyncio.run(_walk_async(sort_by, sort_order))
+    assert len(unpaged) == 20
+    assert ids == unpaged
+
+
+def _raw_cursor(payload) -> str:
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+@pytest.mark.parametrize("sort_by, value", [
+    ("price", "abc"),
+    ("price", {"x": 1}),
+    ("price", [1, 2]),
+    ("price", True),
+    ("price", None),
+    ("created_at", 123),
+    ("created_at", "zzz"),
+    ("created_at", {"dt": "zzz"}),
+    ("created_at", {"dt": 123}),
+    ("title", 5),
+    ("title", {"dt": "2026-10-18T21:14:41"}),
+    ("author", ["a"]),
+])
+def test_cursor_with_wrong_value_type_is_rejected(client, sort_by, value):
+    cursor = _raw_cursor({"s": sort_by, "o": "asc", "v": value, "id": 1})
+    response = client.get("/advertisement/", params={"sort_by": sort_by, "sort_order": "asc", "cursor": cursor})
+    assert response.status_code == 400, response.text
+
+
+@pytest.mark.parametrize("cursor", [
+    _raw_cursor([1, 2]),
+    _raw_cursor({"s": "price", "o": "asc", "v": 1.5, "id": "abc"}),
+    _raw_cursor({"s": "price", "o": "asc", "v": 1.5, "id": 2 ** 80}),
+    _raw_cursor({"s": "price", "o": "asc", "v": 1.5}),
+    _raw_cursor({"s": "price", "o": "desc", "v": 1.5, "id": 1}),
+    "garbage!",
+])
+def test_malformed_cursor_is_rejected(client, cursor):
+    response = client.get("/advertisement/", params={"sort_by": "price", "sort_order": "asc", "cursor": cursor})
+    assert response.status_code == 400, response.text
@@ -0,0 +1,23 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import querystats
+from app.database import engine
+
+
+def test_failed_statement_leaves_nothing_on_connection():
+    stats = querystats.RequestQueries({"path": "/test"})
+    token = querystats._current.set(stats)
+    try:
+        with engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.execute(text("SELECT * FROM missing_table"))
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+            assert "query_start" not in conn.info
+    finally:
+        querystats._current.reset(token)
+    # Учтен только выполненный запрос, время не включает упавшие
+    assert stats.count == 1
+    assert 0 <= stats.db_time < 1
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.responses import JSONResponse
+
+from app import models, schemas, serialization
+from app.config import settings
+
+
+def _fastapi_body(rows):
+    # Обычный путь: модель pydantic и JSONResponse, как при FAST_SERIALIZATION=false
+    data = [
+        schemas.Advertisement.model_validate(dict(zip(serialization.ADVERTISEMENT_FIELDS, row))).model_dump(mode="json")
+        for row in rows
+    ]
+    return JSONResponse(content=data).body
+
+
+def _row(price, created_at, id=1, description="description"):
+    values = {
+        "id": id,
+        "title": "title",
+        "description": description,
+        "price": price,
+        "author": "author",
+        "owner_id": 1,
+        "created_at": created_at,
+    }
+    return tuple(values[field] for field in serialization.ADVERTISEMENT_FIELDS)
+
+
+def _get_both(client, params, monkeypatch):
+    # Быстрый путь действительно выполняется при FAST_SERIALIZATION=true
+    calls = []
+    rows_json = serialization.advertisement_rows_json
+    monkeypatch.setattr(
+        serialization, "advertisement_rows_json", lambda rows: calls.append(len(rows)) or rows_json(rows)
+    )
+    bodies = []
+    for fast in (True, False):
+        settings.FAST_SERIALIZATION = fast
+        try:
+            response = client.get("/advertisement/", params=params)
+        finally:
+            settings.FAST_SERIALIZATION = False
+        assert response.status_code == 200, response.text
+        bodies.append(response.content)
+    assert len(calls) == 1 and calls[0]
+    return bodies
+
+
+NAIVE = datetime(2026, 10, 18, 21, 14, 41)
+AWARE = datetime(2026, 10, 18, 21, 14, 41, 123456, tzinfo=timezone.utc)
+OFFSET = datetime(2026, 10, 18, 23, 14, 41, tzinfo=timezone(timedelta(hours=2)))
+
+
+@pytest.mark.parametrize("price", [1.0, 0.5, 12.25, 1e-4, 123456789.125, 9999999999999998.0])
+@pytest.mark.parametrize("created_at", [NAIVE, NAIVE.replace(microsecond=500), AWARE, OFFSET])
+def test_orjson_branch_matches_fastapi(price, created_at):
+    rows = [_row(price, created_at), _row(price, created_at, id=2, description=None)]
+    assert serialization._orjson_compatible(price)
+    assert serialization.advertisement_rows_json(rows) == _fastapi_body(rows)
+
+
+@pytest.mark.parametrize("price", [1e16, 2.5e20, 9.9e-5, 1e-7])
+@pytest.mark.parametrize("created_at", [NAIVE, AWARE, OFFSET])
+def test_fallback_branch_matches_fastapi(price, created_at):
+    rows = [_row(1.5, created_at), _row(price, created_at, id=2)]
+    assert not serialization._orjson_compatible(price)
+    assert serialization.advertisement_rows_json(rows) == _fastapi_body(rows)
+
+
+def test_empty_page_matches_fastapi():
+    assert serialization.advertisement_rows_json([]) == _fastapi_body([])
+
+
+def _add(db, price, created_at=None):
+    advertisement = models.Advertisement(
+        title=f"item {price}", description="text", price=price, author="seller", owner_id=1,
+        created_at=created_at
+    )
+    db.add(advertisement)
+    db.commit()
+
+
+def test_search_body_is_identical(client, db, monkeypatch):
+    for price in (1.0, 19.99, 250.5, 1e9):
+        _add(db, price, NAIVE)
+    _add(db, 7.5, AWARE)
+    _add(db, 8.5)
+
+    fast, regular = _get_both(client, {"sort_by": "price", "sort_order": "asc"}, monkeypatch)
+    assert fast == regular
+    assert len(client.get("/advertisement/").json()) == 6
+
+
+@pytest.mark.parametrize("price", [1e16, 3e-5])
+def test_search_body_is_identical_for_fallback_prices(client, db, monkeypatch, price):
+    _add(db, 10.0, NAIVE)
+    _add(db, price, AWARE)
+    _add(db, 20.0)
+
+    fast, regular = _get_both(client, {"sort_by": "created_at", "sort_order": "desc"}, monkeypatch)
+    assert fast == regular
@@ -0,0 +1,109 @@
+import itertools
+import json
+
+import pytest
+from sqlalchemy import update
+
+from app import models, revocations
+from app.auth import create_access_token
+from app.cache import principal_cache
+from app.database import SessionLocal
+
+_names = itertools.count(1)
+
+
+@pytest.fixture(autouse=True)
+def clean_revocations():
+    # SQLite снова выдает id удаленного пользователя: отзыв из прошлого теста не должен действовать
+    yield
+    with revocations.revocations._lock:
+        revocations.revocations._entries.clear()
+
+
+@pytest.fixture
+def user(client):
+    # Новый пользователь на тест: отзывы и кэш пользователей одного теста не влияют на другие
+    username = f"token_user_{next(_names)}"
+    response = client.post(
+        "/user/", json={"username": username, "password": "secret123", "email": f"{username}@example.com"}
+    )
+    assert response.status_code == 201, response.text
+    return {"id": response.json()["id"], "username": username, "password": "secret123"}
+
+
+def _bearer(token: str) -> dict:
+    return {"Authorization": "Bearer " + token}
+
+
+def test_revocation_from_another_worker_invalidates_cached_user(client, user, monkeypatch):
+    monkeypatch.setattr(principal_cache, "maxsize", 100)
+    # Токен без версии (выдан до refresh-токенов) всегда проверяется по пользователю
+    legacy_token = create_access_token({"sub": user["username"], "user_id": user["id"]})
+    assert client.get("/user/", headers=_bearer(legacy_token)).status_code == 200
+    assert principal_cache.get(user["id"]) is not None
+
+    # Другой воркер сменил пароль: строка в БД изменена, сюда пришло только уведомление
+    with SessionLocal() as db:
+        db.execute(update(models.User).where(models.User.id == user["id"]).values(token_version=1))
+        db.commit()
+    revocations._handle_notifications([json.dumps({"user_id": user["id"], "version": 1})])
+
+    assert principal_cache.get(user["id"]) is None
+    assert client.get("/user/", headers=_bearer(legacy_token)).status_code == 401
+
+
+@pytest.fixture(params=["database", "stateless"])
+def auth_mode(request, monkeypatch):
+    # stateless: список отзывов считается полным, access-токен проверяется без БД
+    if request.param == "stateless":
+        monkeypatch.setattr(revocations.revocations, "complete", lambda: True)
+    return request.param
+
+
+def _login(client, user) -> dict:
+    response = client.post("/login", json={"username": user["username"], "password": user["password"]})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_refresh_token_is_rejected_as_access_token(client, user, auth_mode):
+    tokens = _login(client, user)
+    assert client.get("/user/", headers=_bearer(tokens["access_token"])).status_code == 200
+    assert client.get("/user/", headers=_bearer(tokens["refresh_token"])).status_code == 401
+
+
+def test_access_token_is_rejected_on_refresh(client, user):
+    tokens = _login(client, user)
+    assert client.post("/refresh", json={"refresh_token": tokens["access_token"]}).status_code == 401
+
+
+def test_refresh_issues_new_access_token(client, user, auth_mode):
+    tokens = _login(client, user)
+    response = client.post("/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200, response.text
+    refreshed = response.json()
+    assert refreshed["token_type"] == "bearer" and refreshed["expires_in"] > 0
+    assert client.get("/user/", headers=_bearer(refreshed["access_token"])).json()["id"] == user["id"]
+    assert client.post("/refresh", json={"refresh_token": refreshed["refresh_token"]}).status_code == 200
+
+
+def test_password_change_revokes_existing_tokens(client, user, auth_mode):
+    tokens = _login(client, user)
+    headers = _bearer(tokens["access_token"])
+    response = client.patch(f"/user/{user['id']}", json={"password": "changed123"}, headers=headers)
+    assert response.status_code == 200, response.text
+
+    assert client.get("/user/", headers=headers).status_code == 401
+    assert client.post("/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+    # Новый вход с новым паролем работает
+    fresh = _login(client, dict(user, password="changed123"))
+    assert client.get("/user/", headers=_bearer(fresh["access_token"])).status_code == 200
+
+
+def test_user_deletion_revokes_existing_tokens(client, user, auth_mode):
+    tokens = _login(client, user)
+    headers = _bearer(tokens["access_token"])
+    assert client.delete(f"/user/{user['id']}", headers=headers).status_code == 204
+
+    assert client.get("/user/", headers=headers).status_code == 401
+    assert client.post("/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401